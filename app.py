@@ -1,8 +1,12 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask import Flask, Response, request, jsonify, send_from_directory, abort
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, current_user
 from flask_cors import CORS
 from datetime import timedelta
+from sqlalchemy import func, select
+import json
 import os
+import string
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,15 +20,48 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///iom
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
+app.config['MESSAGE_STREAM_KEEPALIVE'] = 20  # seconds between SSE heartbeats
+app.config['MESSAGE_STREAM_MAX_SECONDS'] = 300  # clients reconnect after this
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))  # logins rehash to this cost
+app.config['LOGIN_HASH_WORKERS'] = int(os.getenv('LOGIN_HASH_WORKERS', 0)) or None  # default: min(4, cores)
+app.config['LOGIN_HASH_MAX_PENDING'] = int(os.getenv('LOGIN_HASH_MAX_PENDING', 0)) or None  # default: 8 per worker
+app.config['LOGIN_HASH_TIMEOUT'] = 10  # seconds a login waits for its bcrypt check
+app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; smaller API responses go out as-is
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip 1-9
+app.config['COMPRESS_BR_LEVEL'] = int(os.getenv('COMPRESS_BR_LEVEL', 5))  # brotli 0-11
+app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER')  # 'orjson' (default when installed) or 'stdlib'
+app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(app.root_path, 'uploads'))
+app.config['UPLOADS_OFFLOAD'] = os.getenv('UPLOADS_OFFLOAD')  # None, 'x-sendfile' or 'x-accel'
+app.config['UPLOADS_ACCEL_PREFIX'] = os.getenv('UPLOADS_ACCEL_PREFIX', '/protected-uploads')  # nginx internal location
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 100)) * 1024 * 1024  # largest request body / upload
+app.config['UPLOAD_SESSION_MAX_AGE'] = 24 * 3600  # seconds an unfinished resumable upload may sit idle
+app.config['TENANT_DATABASES'] = json.loads(os.getenv('TENANT_DATABASES', '{}'))  # {org id: database URL}, see tenancy.py
 
 # Import db and bcrypt from models and initialize with app
 from models import db, bcrypt, Message, User, Post
+from pagination import parse_limit, encode_cursor, decode_cursor
+from message_hub import message_hub, is_visible_to
+from password_pool import login_pool
+from user_cache import init_user_loader
+from static_assets import static_assets, REVALIDATE
+from storage import send_upload
+from json_provider import init_json
+from compression import init_compression
+from notifications import notify, org_audience
+import conversations
+import tenancy
 
 # Initialize extensions with app
+init_json(app)
 db.init_app(app)
 bcrypt.init_app(app)
+login_pool.init_app(app)
 jwt = JWTManager(app)
+init_user_loader(jwt)
+tenancy.init_tenancy(app)
 CORS(app)
+static_assets.init_app(app)
+init_compression(app)
 
 # Import routes after app initialization
 from routes import auth_bp
@@ -39,66 +76,151 @@ app.register_blueprint(chat_bp, url_prefix='/api')
 # Serve static HTML files
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return static_assets.send_page('index.html')
 
 @app.route('/login')
 def login_page():
-    return send_from_directory('.', 'login.html')
+    return static_assets.send_page('login.html')
 
 @app.route('/profile')
 def profile_page():
-    return send_from_directory('.', 'profile.html')
+    return static_assets.send_page('profile.html')
 
 @app.route('/events')
 def events_page():
-    return send_from_directory('.', 'events.html')
+    return static_assets.send_page('events.html')
 
 @app.route('/calendar')
 def calendar_page():
-    return send_from_directory('.', 'calander.html')
+    return static_assets.send_page('calander.html')
 
 @app.route('/classroom.html')
 def classroom_page():
-    return send_from_directory('.', 'classroom.html')
+    return static_assets.send_page('classroom.html')
 
 @app.route('/settings')
 def settings_page():
-    return send_from_directory('.', 'settings.html')
+    return static_assets.send_page('settings.html')
+
+@app.route('/assets/<path:filename>')
+def fingerprinted_asset(filename):
+    """Content-hashed asset URLs - safe to cache forever"""
+    asset = static_assets.hashed.get(filename)
+    if asset is None:
+        abort(404)
+    return static_assets.send(asset)
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory('uploads', filename)
+    return send_upload(filename)
 
 @app.route('/messages')
 def messages_page():
-    return send_from_directory('.', 'messages.html')
+    return static_assets.send_page('messages.html')
 
 # --- Messaging API Endpoints ---
 
+def visible_messages(user_id, query=None):
+    """Messages where user is sender, receiver, or it's a broadcast from their organization"""
+    query = Message.list_query() if query is None else query
+    broadcast = Message.message_type == 'broadcast'
+    org_id = tenancy.current_org_id()
+    if org_id is not None:
+        broadcast &= Message.sender_id.in_(select(User.id).where(User.organization_id == org_id))
+    return query.filter(
+        (Message.sender_id == user_id) | 
+        (Message.receiver_id == user_id) | 
+        broadcast
+    )
+
+# SQLite's lower() only folds ASCII letters; search text is folded the same way
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _prefix_range(column, prefix):
+    """column LIKE 'prefix%' as a range both SQLite and the index understand"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (column >= prefix) & (column < upper)
+
 @app.route('/api/users', methods=['GET'])
 @jwt_required()
 def get_users():
-    users = User.query.all()
-    return jsonify([u.to_dict() for u in users])
+    """The user directory, ordered by name, one keyset page at a time
+    
+    ?q= matches a prefix of the name or email, ?role= and ?organization_id=
+    filter, ?compact=1 returns only id/name/role (for pickers) and
+    ?after=<next_cursor> returns the next page. Users in an organization
+    only see its members.
+    """
+    fields = User.COMPACT_FIELDS if request.args.get('compact') in ('1', 'true') else User.ROW_FIELDS
+    limit = parse_limit(default=50, maximum=200)
+    sort_name = func.lower(User.name)
+    query = db.session.query(sort_name, *(getattr(User, f) for f in fields))
+    
+    q = request.args.get('q', '').strip().translate(_ASCII_LOWER)
+    if q:
+        query = query.filter(_prefix_range(sort_name, q) | _prefix_range(func.lower(User.email), q))
+    if request.args.get('role'):
+        query = query.filter(User.role == request.args['role'])
+    organization_id = tenancy.current_org_id() or request.args.get('organization_id', type=int)
+    if organization_id is not None:
+        query = query.filter(User.organization_id == organization_id)
+    
+    after = request.args.get('after')
+    if after:
+        cursor = decode_cursor(after)
+        if not isinstance(cursor, list) or len(cursor) != 2:
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+        # Spelled out rather than a row-value comparison, which SQLite can't
+        # turn into a range on the expression index
+        name, user_id = cursor
+        query = query.filter(sort_name >= name, (sort_name > name) | (User.id > user_id))
+    
+    rows = query.order_by(sort_name, User.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1].id) if len(rows) > limit else None
+    return jsonify({'users': [User.row_dict(row[1:], fields) for row in rows[:limit]], 'next_cursor': next_cursor})
 
 @app.route('/api/messages', methods=['GET'])
 @jwt_required()
 def get_messages():
     current_user_id = int(get_jwt_identity())
     
-    # Get messages where user is sender, receiver, or it's a broadcast
-    messages = Message.query.filter(
-        (Message.sender_id == current_user_id) | 
-        (Message.receiver_id == current_user_id) | 
-        (Message.message_type == 'broadcast')
-    ).order_by(Message.timestamp.asc()).all()
+    # Plain rows straight to the JSON provider - no ORM objects or isoformat() per row
+    query = visible_messages(current_user_id, Message.row_query())
+    
+    # ?peer_id=N narrows it to the direct thread with one user
+    peer_id = request.args.get('peer_id', type=int)
+    if peer_id is not None:
+        query = query.filter(
+            ((Message.sender_id == current_user_id) & (Message.receiver_id == peer_id)) |
+            ((Message.sender_id == peer_id) & (Message.receiver_id == current_user_id))
+        )
     
-    return jsonify([m.to_dict() for m in messages])
+    since_id = request.args.get('since_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    
+    if since_id is None and before_id is None and 'limit' not in request.args:
+        # Legacy mode: full history
+        rows = query.order_by(Message.timestamp.asc()).all()
+        return jsonify([Message.row_dict(r) for r in rows])
+    
+    # Delta mode: keyset on Message.id, which grows with Message.timestamp.
+    # ?since_id=N returns the next page of messages newer than N (oldest first),
+    # ?before_id=N returns the page of messages just older than N.
+    limit = parse_limit(default=50, maximum=200)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    if since_id is not None:
+        query = query.filter(Message.id > since_id)
+        rows = query.order_by(Message.id.asc()).limit(limit).all()
+    else:
+        rows = query.order_by(Message.id.desc()).limit(limit).all()
+        rows.reverse()
+    
+    return jsonify([Message.row_dict(r) for r in rows])
 
 @app.route('/api/messages', methods=['POST'])
 @jwt_required()
 def send_message():
-    current_user_id = int(get_jwt_identity())
     data = request.get_json()
     
     if not data.get('content'):
@@ -112,20 +234,141 @@ def send_message():
         receiver_id = None
     
     new_message = Message(
-        sender_id=current_user_id,
+        sender_id=current_user.id,
         receiver_id=receiver_id,
         content=data['content'],
         message_type=message_type
     )
     
     db.session.add(new_message)
+    conversations.record_message(new_message)
+    if message_type == 'broadcast':
+        recipients = org_audience(current_user.organization_id, exclude_user_id=current_user.id)
+    else:
+        recipients = [receiver_id]
+    notify(recipients, 'message', f'New message from {current_user.name}', data['content'][:100], link='/messages')
+    db.session.commit()
+    
+    message_data = new_message.to_dict()
+    message_hub.publish(message_data, tenancy.current_bind_key(), current_user.organization_id)
+    
+    return jsonify(message_data), 201
+
+@app.route('/api/messages/read', methods=['POST'])
+@jwt_required()
+def mark_conversation_read():
+    """Mark a peer's messages to me read, up to and including up_to_id (default: all)"""
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    
+    peer_id = data.get('peer_id')
+    up_to_id = data.get('up_to_id')
+    if not isinstance(peer_id, int) or (up_to_id is not None and not isinstance(up_to_id, int)):
+        return jsonify({'error': 'peer_id (and optional up_to_id) must be integers'}), 400
+    
+    unread = conversations.mark_read(current_user_id, peer_id, up_to_id)
     db.session.commit()
+    return jsonify({'peer_id': peer_id, 'unread_count': unread})
+
+@app.route('/api/messages/conversations', methods=['GET'])
+@jwt_required()
+def get_conversations():
+    """The current user's direct-message threads, most recent first
+    
+    ?before_id=N (the last entry's last_message.id) returns the next page.
+    """
+    limit = parse_limit(default=20, maximum=100)
+    page = conversations.conversation_page(int(get_jwt_identity()), limit, request.args.get('before_id', type=int))
+    next_before_id = page[-1]['last_message']['id'] if len(page) == limit else None
+    return jsonify({'conversations': page, 'next_before_id': next_before_id})
+
+@app.route('/api/messages/unread', methods=['GET'])
+@jwt_required()
+def get_unread_counts():
+    """Unread direct messages per peer, for inbox badges"""
+    by_peer = conversations.unread_counts(int(get_jwt_identity()))
+    return jsonify({'total': sum(by_peer.values()), 'by_peer': by_peer})
+
+# Rows per query when a stream catches up from the database
+CATCH_UP_BATCH = 200
+
+def _sse(message):
+    return f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+
+@app.route('/api/messages/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_messages():
+    """Server-Sent Events feed of new messages for the current user
+
+    EventSource can't send headers, so the token may be passed as ?jwt=.
+    On reconnect the browser sends Last-Event-ID and we catch up from there.
+    """
+    current_user_id = int(get_jwt_identity())
+    org_id, bind_key = tenancy.current_org_id(), tenancy.current_bind_key()
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since_id', type=int)
+    keepalive = app.config['MESSAGE_STREAM_KEEPALIVE']
+    deadline = time.monotonic() + app.config['MESSAGE_STREAM_MAX_SECONDS']
+    
+    # Anything published from here on reaches us through the hub
+    seq = message_hub.current_seq
+    
+    def catch_up(since_id):
+        """Every visible message after since_id, read in batches until drained"""
+        messages = []
+        with app.app_context():
+            tenancy.activate(org_id)
+            while True:
+                rows = visible_messages(current_user_id).filter(Message.id > since_id) \
+                    .order_by(Message.id.asc()).limit(CATCH_UP_BATCH).all()
+                messages.extend(m.to_dict() for m in rows)
+                if len(rows) < CATCH_UP_BATCH:
+                    return messages
+                since_id = rows[-1].id
+    
+    if last_id is None:
+        # A fresh connection starts from now; a later catch-up must not replay old history
+        last_id = visible_messages(current_user_id, db.session.query(func.max(Message.id))).scalar() or 0
+        backlog = []
+    else:
+        backlog = catch_up(last_id)
+    
+    def generate():
+        nonlocal seq
+        sent = {m['id'] for m in backlog}
+        newest = max(sent, default=last_id)
+        
+        yield 'retry: 3000\n\n'
+        for message in backlog:
+            yield _sse(message)
+        
+        # Idle connections just sleep on the hub - no queries until something is sent
+        while time.monotonic() < deadline:
+            seq, messages, complete = message_hub.wait(seq, keepalive, bind_key, org_id)
+            if not complete:
+                messages = catch_up(newest)
+            
+            fresh = [m for m in messages if m['id'] not in sent and is_visible_to(m, current_user_id)]
+            if not messages:
+                yield ': keepalive\n\n'
+            for message in fresh:
+                sent.add(message['id'])
+                newest = max(newest, message['id'])
+                yield _sse(message)
     
-    return jsonify(new_message.to_dict()), 201
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # Serve static files (CSS, JS, images)
 @app.route('/<path:path>')
 def serve_static(path):
+    static_file = static_assets.get(path)
+    if static_file is not None:
+        # Un-fingerprinted URL, so it may change - revalidate every time
+        return static_assets.send(static_file, REVALIDATE)
     return send_from_directory('.', path)
 
 # Create database tables
@@ -0,0 +1,110 @@
+"""
+Attendance recording and aggregation
+
+Attendance is unique per (classroom, student, date): recording it again
+corrects the existing row. Every change is mirrored into AttendanceSummary
+in the same transaction, so a student's totals are a primary-key lookup no
+matter how much history they have.
+"""
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import db, Attendance, AttendanceSummary
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'excused')
+
+
+def _adjust_summary(classroom_id, user_id, status, delta):
+    """Add delta to the summary counters for one status"""
+    values = {AttendanceSummary.total: AttendanceSummary.total + delta}
+    if status in ATTENDANCE_STATUSES:
+        column = getattr(AttendanceSummary, status)
+        values[column] = column + delta
+
+    updated = AttendanceSummary.query.filter_by(user_id=user_id, classroom_id=classroom_id) \
+        .update(values, synchronize_session=False)
+    if not updated:
+        counts = {s: 0 for s in ATTENDANCE_STATUSES}
+        if status in counts:
+            counts[status] = delta
+        db.session.add(AttendanceSummary(user_id=user_id, classroom_id=classroom_id, total=delta, **counts))
+        db.session.flush()
+
+
+def _upsert(existing, classroom_id, user_id, date, status):
+    """Insert or correct one row; returns 'created', 'updated' or 'unchanged'"""
+    if existing is None:
+        db.session.add(Attendance(classroom_id=classroom_id, user_id=user_id, date=date, status=status))
+        _adjust_summary(classroom_id, user_id, status, 1)
+        return 'created'
+    if existing.status == status:
+        return 'unchanged'
+    _adjust_summary(classroom_id, user_id, existing.status, -1)
+    _adjust_summary(classroom_id, user_id, status, 1)
+    existing.status = status
+    existing.recorded_at = datetime.utcnow()
+    return 'updated'
+
+
+def record_attendance(classroom_id, user_id, date, status):
+    """Record one student's attendance and update the summary - the caller commits"""
+    existing = Attendance.query.filter_by(classroom_id=classroom_id, date=date, user_id=user_id).first()
+    return _upsert(existing, classroom_id, user_id, date, status)
+
+
+def record_class_attendance(classroom_id, date, roster):
+    """Record a whole class for one date from {student_id: status}
+
+    Existing rows are loaded in one query and corrected in place, so the
+    same roster can be submitted again safely. The caller commits.
+    Returns counts of created / updated / unchanged rows.
+    """
+    existing = {a.user_id: a for a in Attendance.query.filter(
+        Attendance.classroom_id == classroom_id,
+        Attendance.date == date,
+        Attendance.user_id.in_(list(roster))
+    )}
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for user_id, status in roster.items():
+        counts[_upsert(existing.get(user_id), classroom_id, user_id, date, status)] += 1
+    return counts
+
+
+def attendance_totals(user_id):
+    """Return (total, present) for a student across all classrooms"""
+    total, present = db.session.query(
+        func.coalesce(func.sum(AttendanceSummary.total), 0),
+        func.coalesce(func.sum(AttendanceSummary.present), 0)
+    ).filter(AttendanceSummary.user_id == user_id).one()
+    return int(total), int(present)
+
+
+def remove_duplicate_attendance():
+    """Keep only the latest row per (classroom, student, date), e.g. before adding the unique index"""
+    latest = db.session.query(func.max(Attendance.id)) \
+        .group_by(Attendance.classroom_id, Attendance.date, Attendance.user_id)
+    removed = Attendance.query.filter(Attendance.id.not_in(latest)).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def rebuild_attendance_summaries():
+    """Recompute every summary from the attendance table, e.g. after an upgrade"""
+    rows = db.session.query(
+        Attendance.user_id, Attendance.classroom_id, Attendance.status, func.count(Attendance.id)
+    ).group_by(Attendance.user_id, Attendance.classroom_id, Attendance.status).all()
+
+    summaries = {}
+    for user_id, classroom_id, status, count in rows:
+        summary = summaries.setdefault((user_id, classroom_id), dict(
+            user_id=user_id, classroom_id=classroom_id, total=0, **{s: 0 for s in ATTENDANCE_STATUSES}))
+        summary['total'] += count
+        if status in ATTENDANCE_STATUSES:
+            summary[status] += count
+
+    AttendanceSummary.query.delete()
+    if summaries:
+        db.session.execute(AttendanceSummary.__table__.insert(), list(summaries.values()))
+    db.session.commit()
+    return len(summaries)
@@ -0,0 +1,84 @@
+"""
+Benchmark list-endpoint serialization: ORM objects + to_dict() vs plain rows,
+each encoded with the stdlib and the orjson JSON providers.
+
+Runs against a scratch in-memory database.
+
+Usage: python bench_serialization.py [--users N] [--messages N] [--repeat N]
+       python bench_serialization.py > bench_output.txt
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import app
+from json_provider import OrjsonProvider, StdlibJSONProvider, orjson
+from models import db, User, Message
+
+
+def seed(users, messages):
+    """Insert users and messages in bulk"""
+    start = datetime(2025, 1, 1)
+    db.session.execute(db.insert(User), [
+        {'name': f'User {i}', 'email': f'user{i}@bench.test', 'password_hash': 'x',
+         'role': 'student', 'created_at': start + timedelta(seconds=i)}
+        for i in range(users)
+    ])
+    db.session.execute(db.insert(Message), [
+        {'sender_id': i % users + 1, 'receiver_id': (i + 1) % users + 1, 'content': f'message {i}',
+         'message_type': 'direct', 'is_read': False, 'timestamp': start + timedelta(seconds=i)}
+        for i in range(messages)
+    ])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    """Best wall time of repeat runs, in ms"""
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    providers = {'stdlib': StdlibJSONProvider(app)}
+    if orjson:
+        providers['orjson'] = OrjsonProvider(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.users, args.messages)
+
+        endpoints = {
+            '/api/users': (lambda: [u.to_dict() for u in User.query.all()],
+                           lambda: [User.row_dict(r) for r in User.row_query()]),
+            '/api/messages': (lambda: [m.to_dict() for m in Message.list_query().order_by(Message.id)],
+                              lambda: [Message.row_dict(r) for r in Message.row_query().order_by(Message.id)]),
+        }
+
+        print(f'{args.users:,} users, {args.messages:,} messages, best of {args.repeat}')
+        print(f"{'endpoint':<16}{'path':<12}{'provider':<10}{'ms':>10}{'speedup':>10}")
+        for url, (objects, rows) in endpoints.items():
+            baseline = None
+            for path, build in (('to_dict', objects), ('rows', rows)):
+                for name, provider in providers.items():
+                    ms = timed(lambda: provider.response(build()), args.repeat)
+                    baseline = baseline or ms
+                    print(f'{url:<16}{path:<12}{name:<10}{ms:>10.1f}{baseline / ms:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -60,13 +60,17 @@ async function loadEvents() {
     const token = localStorage.getItem('token');
     const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
     
-    const res = await fetch('/api/events', { headers });
+    // Only ask for the displayed month
+    const from = new Date(currentMonth.getFullYear(), currentMonth.getMonth(), 1).toISOString();
+    const to = new Date(currentMonth.getFullYear(), currentMonth.getMonth() + 1, 1).toISOString();
+    const res = await fetch(`/api/events?from=${encodeURIComponent(from)}&to=${encodeURIComponent(to)}`, { headers });
     const data = await res.json();
     
     if (data.success) {
       data.events.forEach(e => {
-        const date = new Date(e.date);
-        // Check if event is in current month view
+        // Stored dates are UTC without a zone suffix
+        const date = new Date(/[zZ]|[+-]\d\d:\d\d$/.test(e.date) ? e.date : e.date + 'Z');
+        // The user may have moved to another month while this request was in flight
         if (date.getMonth() === currentMonth.getMonth() && date.getFullYear() === currentMonth.getFullYear()) {
           const dayEl = document.getElementById(`day-${date.getFullYear()}-${date.getMonth() + 1}-${date.getDate()}`);
           if (dayEl) {
@@ -1,17 +1,28 @@
-from flask import Blueprint, request, jsonify
-from models import db, User, ChatMessage, Event, EventRegistration, Announcement, Classroom, Material, Attendance
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from models import db, ChatMessage, Event, EventRegistration, Announcement, Classroom, Material, Attendance
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from datetime import datetime
 from groq import Groq
+from cache import user_context_cache, shared_context_cache, llm_response_cache
+import tenancy
+from attendance import attendance_totals
+from user_cache import get_user_snapshot
+import hashlib
 import os
 import json
 
 chat_bp = Blueprint('chatbot', __name__)
 
+LLM_MODEL = "llama-3.3-70b-versatile"  # Groq's powerful model
+
 # Initialize Groq client
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 try:
-    if GROQ_API_KEY:
+    if os.getenv("GROQ_FAKE"):
+        from fake_groq import FakeGroq
+        client = FakeGroq(latency=float(os.getenv("GROQ_FAKE_LATENCY", "0.5")))
+        print("✓ Using offline fake Groq client")
+    elif GROQ_API_KEY:
         client = Groq(api_key=GROQ_API_KEY)
         print("✓ Groq AI client initialized successfully")
     else:
@@ -21,64 +32,92 @@ except Exception as e:
     print(f"❌ Groq init error: {e}")
     client = None
 
-def get_user_context(user_id):
-    """Fetch comprehensive user context from database"""
+def _get_shared_context():
+    """Context that is the same for every user of an organization - cached once for all of them"""
+    key = tenancy.cache_key(('shared', tenancy.current_org_id()))
+    context = shared_context_cache.get(key)
+    if context is not None:
+        return context
+    
+    context = {}
+    
+    # Get classrooms
     try:
-        user = User.query.get(user_id)
-        if not user:
-            return {}
-        
-        context = {
-            'name': user.name,
-            'email': user.email,
-            'role': user.role,
-            'user_id': user.id
-        }
-        
-        # Get attendance data
-        if user.role == 'student':
-            try:
-                attendance_records = Attendance.query.filter_by(user_id=user_id).all()
-                total = len(attendance_records)
-                present = sum(1 for a in attendance_records if a.status == 'present')
-                context['attendance'] = {
-                    'total': total,
-                    'present': present,
-                    'percentage': round((present / total * 100) if total > 0 else 0, 2)
-                }
-            except Exception:
-                context['attendance'] = {'total': 0, 'present': 0, 'percentage': 0}
-            
-            # Get enrolled classrooms
-            try:
-                classrooms = Classroom.query.all()  # In real app, filter by user enrollment
-                context['classrooms'] = [{'id': c.id, 'name': c.name, 'teacher': c.teacher_name} for c in classrooms[:5]]
-            except Exception:
-                context['classrooms'] = []
-            
-        # Get registered events - handle schema mismatch
-        try:
-            registrations = EventRegistration.query.filter_by(user_id=user_id).all()
-            event_ids = [r.event_id for r in registrations]
-            events = Event.query.filter(Event.id.in_(event_ids)).all() if event_ids else []
-            context['registered_events'] = [{'id': e.id, 'title': e.title, 'date': e.date.isoformat() if e.date else None} for e in events[:5]]
-        except Exception:
-            context['registered_events'] = []
-        
-        # Get upcoming events
+        classrooms = tenancy.scoped(Classroom.list_query(), Classroom).limit(5).all()  # In real app, filter by user enrollment
+        context['classrooms'] = [{'id': c.id, 'name': c.name, 'teacher': c.teacher.name if c.teacher else 'Unknown'} for c in classrooms]
+    except Exception:
+        context['classrooms'] = []
+    
+    # Get upcoming events
+    try:
+        upcoming_events = tenancy.scoped(Event.query, Event).filter(Event.date >= datetime.now().date()).order_by(Event.date).limit(5).all()
+        context['upcoming_events'] = [{'id': e.id, 'title': e.title, 'date': e.date.isoformat() if e.date else None} for e in upcoming_events]
+    except Exception:
+        context['upcoming_events'] = []
+    
+    # Get recent announcements
+    try:
+        announcements = tenancy.scoped(Announcement.query, Announcement).order_by(Announcement.created_at.desc()).limit(3).all()
+        context['recent_announcements'] = [{'id': a.id, 'title': a.title, 'content': a.content[:100]} for a in announcements]
+    except Exception:
+        context['recent_announcements'] = []
+    
+    shared_context_cache.set(key, context)
+    return context
+
+def _get_personal_context(user_id):
+    """Context specific to one user - cached until one of their records changes"""
+    context = user_context_cache.get(tenancy.cache_key(user_id))
+    if context is not None:
+        return context
+    
+    user = get_user_snapshot(user_id)
+    if not user:
+        return {}
+    
+    context = {
+        'name': user.name,
+        'email': user.email,
+        'role': user.role,
+        'user_id': user.id
+    }
+    
+    # Get attendance data
+    if user.role == 'student':
         try:
-            upcoming_events = Event.query.filter(Event.date >= datetime.now().date()).order_by(Event.date).limit(5).all()
-            context['upcoming_events'] = [{'id': e.id, 'title': e.title, 'date': e.date.isoformat() if e.date else None} for e in upcoming_events]
+            total, present = attendance_totals(user_id)
+            context['attendance'] = {
+                'total': total,
+                'present': present,
+                'percentage': round((present / total * 100) if total > 0 else 0, 2)
+            }
         except Exception:
-            context['upcoming_events'] = []
+            context['attendance'] = {'total': 0, 'present': 0, 'percentage': 0}
         
-        # Get recent announcements
-        try:
-            announcements = Announcement.query.order_by(Announcement.created_at.desc()).limit(3).all()
-            context['recent_announcements'] = [{'id': a.id, 'title': a.title, 'content': a.content[:100]} for a in announcements]
-        except Exception:
-            context['recent_announcements'] = []
+    # Get registered events - handle schema mismatch
+    try:
+        events = Event.query.join(EventRegistration, EventRegistration.event_id == Event.id) \
+            .filter(EventRegistration.user_id == user_id).limit(5).all()
+        context['registered_events'] = [{'id': e.id, 'title': e.title, 'date': e.date.isoformat() if e.date else None} for e in events]
+    except Exception:
+        context['registered_events'] = []
+    
+    user_context_cache.set(tenancy.cache_key(user_id), context)
+    return context
+
+def get_user_context(user_id):
+    """Fetch comprehensive user context, from cache when possible"""
+    try:
+        personal = _get_personal_context(user_id)
+        if not personal:
+            return {}
         
+        shared = _get_shared_context()
+        context = dict(personal)
+        if personal['role'] == 'student':
+            context['classrooms'] = shared['classrooms']
+        context['upcoming_events'] = shared['upcoming_events']
+        context['recent_announcements'] = shared['recent_announcements']
         return context
     except Exception as e:
         print(f"Error getting user context: {e}")
@@ -140,6 +179,65 @@ def build_system_prompt(user, context):
 
     return base_prompt
 
+def _normalize(text):
+    """Collapse case and whitespace so trivially different prompts share a cache entry"""
+    return ' '.join(text.lower().split())
+
+def _cache_key(system_prompt, msg):
+    return hashlib.sha256(json.dumps([LLM_MODEL, system_prompt, _normalize(msg)]).encode('utf-8')).hexdigest()
+
+def complete_chat(system_prompt, msg):
+    """Get an LLM reply, shared between identical prompts
+
+    The system prompt is part of the key, so personalized answers are only
+    ever reused for the same context. Identical prompts arriving together
+    wait on one upstream call instead of each making their own.
+    """
+    key = _cache_key(system_prompt, msg)
+    
+    def call_llm():
+        response = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": msg}
+            ],
+            temperature=0.7,
+            max_tokens=500
+        )
+        return response.choices[0].message.content.strip()
+    
+    return llm_response_cache.get_or_compute(key, call_llm)
+
+def stream_chat(system_prompt, msg):
+    """Yield the LLM reply piece by piece as it is generated
+
+    A cached reply is yielded whole; a fresh one is cached once it completes.
+    """
+    key = _cache_key(system_prompt, msg)
+    cached = llm_response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    stream = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": msg}
+        ],
+        temperature=0.7,
+        max_tokens=500,
+        stream=True
+    )
+    parts = []
+    for chunk in stream:
+        token = chunk.choices[0].delta.content
+        if token:
+            parts.append(token)
+            yield token
+    llm_response_cache.set(key, ''.join(parts).strip())
+
 def generate_data_response(user, context, query):
     """Generate responses with real database data"""
     query_lower = query.lower()
@@ -187,7 +285,6 @@ def generate_data_response(user, context, query):
 @chat_bp.route('/chat', methods=['POST'])
 @jwt_required()
 def chat():
-    current_user_id = int(get_jwt_identity())
     data = request.json
     msg = data.get("message", "").strip()
     
@@ -195,11 +292,11 @@ def chat():
         return jsonify({"reply": "Please ask me something!"}), 400
     
     # Get user and context
-    user = User.query.get(current_user_id)
+    user = current_user
     if not user:
         return jsonify({"reply": "User not found."}), 404
     
-    context = get_user_context(current_user_id)
+    context = get_user_context(user.id)
     
     try:
         # First check if this is a direct data query
@@ -212,21 +309,11 @@ def chat():
         else:
             # Use Groq AI for intelligent responses
             system_prompt = build_system_prompt(user, context)
-            
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",  # Groq's powerful model
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": msg}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            reply = response.choices[0].message.content.strip()
+            reply = complete_chat(system_prompt, msg)
         
         # Save to database
         chat_entry = ChatMessage(
-            user_id=current_user_id,
+            user_id=user.id,
             message=msg,
             response=reply
         )
@@ -244,6 +331,64 @@ def chat():
             "success": False
         }), 500
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """Like /chat, but sends the reply as Server-Sent Events while it is generated
+
+    Emits 'token' events as text arrives, then one 'done' event with the full
+    reply once it has been saved (or an 'error' event).
+    """
+    data = request.json
+    msg = data.get("message", "").strip()
+    
+    if not msg:
+        return jsonify({"reply": "Please ask me something!"}), 400
+    
+    user = current_user
+    if not user:
+        return jsonify({"reply": "User not found."}), 404
+    
+    context = get_user_context(user.id)
+    
+    data_response = generate_data_response(user, context, msg)
+    if data_response:
+        tokens = iter([data_response])
+    elif not client:
+        tokens = iter(["I am currently in offline mode. But I can help with:\n• Attendance\n• Events\n• Announcements\n• Classrooms\nWhat would you like to know?"])
+    else:
+        tokens = stream_chat(build_system_prompt(user, context), msg)
+    
+    @stream_with_context
+    def generate():
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield _sse('token', {'token': token})
+            
+            reply = ''.join(parts).strip()
+            chat_entry = ChatMessage(
+                user_id=user.id,
+                message=msg,
+                response=reply
+            )
+            db.session.add(chat_entry)
+            db.session.commit()
+            yield _sse('done', {'reply': reply, 'success': True})
+        except Exception as e:
+            print(f"❌ Chatbot stream error: {e}")
+            db.session.rollback()
+            yield _sse('error', {'reply': "Sorry, I'm having trouble right now. Please try again in a moment.", 'success': False})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @chat_bp.route('/chat/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
@@ -56,6 +56,16 @@
         chatBox.scrollTop = chatBox.scrollHeight;
     }
 
+    // Empty bot bubble that streamed tokens are appended to
+    function addStreamingBubble() {
+        const div = document.createElement('div');
+        div.className = 'text-left';
+        div.innerHTML = '<span class="inline-block px-3 py-2 rounded-lg max-w-[80%] bg-gray-200 text-black whitespace-pre-wrap"></span>';
+        chatBox.appendChild(div);
+        chatBox.scrollTop = chatBox.scrollHeight;
+        return div.firstChild;
+    }
+
     chatForm.onsubmit = async (e) => {
         e.preventDefault();
         const msg = chatInput.value.trim();
@@ -65,7 +75,8 @@
         chatInput.value = '';
 
         try {
-            const res = await fetch('/api/chat', {
+            // Streamed reply: tokens are rendered as soon as they arrive
+            const res = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -83,8 +94,38 @@
                 return;
             }
 
-            const data = await res.json();
-            addBubble(data.reply || "No response received.", 'bot');
+            if (!res.ok || !res.body) {
+                const data = await res.json();
+                addBubble(data.reply || "No response received.", 'bot');
+                return;
+            }
+
+            const replyEl = addStreamingBubble();
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Server-Sent Events are separated by a blank line
+                const frames = buffer.split('\n\n');
+                buffer = frames.pop();
+                frames.forEach(frame => {
+                    const event = (frame.match(/^event: (.*)$/m) || [])[1];
+                    const data = (frame.match(/^data: (.*)$/m) || [])[1];
+                    if (!data) return;
+                    const payload = JSON.parse(data);
+                    if (event === 'token') {
+                        replyEl.textContent += payload.token;
+                    } else {
+                        replyEl.textContent = payload.reply || replyEl.textContent || "No response received.";
+                    }
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                });
+            }
         } catch (err) {
             console.error(err);
             addBubble("Error connecting to server.", 'bot');
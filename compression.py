@@ -0,0 +1,66 @@
+"""
+Negotiated gzip/brotli compression of dynamic responses
+
+An after_request hook compresses JSON and other text responses bigger than
+COMPRESS_MIN_SIZE for clients that accept it. Streamed responses (SSE,
+send_file), responses that already have a Content-Encoding (precompressed
+static files), partial/empty responses and non-text content are left alone.
+
+Config:
+    COMPRESS_MIN_SIZE   bytes below which compression isn't worth it (1024)
+    COMPRESS_LEVEL      gzip level 1-9 (6)
+    COMPRESS_BR_LEVEL   brotli quality 0-11 (5), used when brotli is installed
+"""
+from flask import request
+
+from static_assets import brotli, compress, is_compressible, negotiate_encoding
+
+AVAILABLE_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def _should_compress(response):
+    if response.status_code != 200 or request.method == 'HEAD':
+        return False
+    if response.is_streamed or response.direct_passthrough:
+        return False
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return is_compressible(response.mimetype or '')
+
+
+def compress_response(response, config):
+    """Compress response in place if it qualifies and the client accepts it"""
+    if not _should_compress(response):
+        return response
+    # Vary even when we end up not compressing, so caches keep encodings apart
+    if response.content_length is None or response.content_length >= config['COMPRESS_MIN_SIZE']:
+        response.vary.add('Accept-Encoding')
+    else:
+        return response
+
+    encoding = negotiate_encoding(AVAILABLE_ENCODINGS)
+    if encoding is None:
+        return response
+
+    level = config['COMPRESS_BR_LEVEL'] if encoding == 'br' else config['COMPRESS_LEVEL']
+    body = compress(response.get_data(), encoding, level)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+    # The bytes differ from the identity response, so the validator becomes weak.
+    # If-None-Match uses the weak comparison, so 304s keep working.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Register the compression hook with defaults for any unset config"""
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 5)
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, app.config)
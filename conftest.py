@@ -0,0 +1,64 @@
+"""
+Shared pytest fixtures - every test runs against a fresh in-memory database
+"""
+import os
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import app as flask_app
+from models import db, User
+import cache
+
+
+@pytest.fixture
+def app():
+    # In-process caches would otherwise leak rows between test databases
+    for value in vars(cache).values():
+        if isinstance(value, cache.TTLCache):
+            value.clear()
+
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user and return it"""
+    counter = {'n': 0}
+
+    def _make_user(role='student', name=None, organization_id=None):
+        counter['n'] += 1
+        user = User(
+            name=name or f'{role.title()} {counter["n"]}',
+            email=f'{role}{counter["n"]}@iomp.test',
+            role=role,
+            organization_id=organization_id
+        )
+        # Plain-text hash keeps the fixture fast; tests that log in set a real one
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    return _make_user
+
+
+@pytest.fixture
+def auth_headers(app):
+    """Return Authorization headers for a user"""
+    def _auth_headers(user):
+        token = create_access_token(identity=str(user.id))
+        return {'Authorization': f'Bearer {token}'}
+
+    return _auth_headers
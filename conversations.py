@@ -0,0 +1,137 @@
+"""
+Per-conversation state for direct messages
+
+Every direct message updates two Conversation rows - the sender's and the
+receiver's view of the thread - in the same transaction as the message:
+the latest message id and time, and for the receiver one more unread.
+Inbox badges and the conversation list then read a handful of rows by
+(user_id, ...) instead of scanning messages.
+
+Message ids grow with time, so last_message_id doubles as the recency
+sort key and the keyset cursor for conversation_page().
+
+All functions leave committing to the caller.
+"""
+from sqlalchemy import case, func, literal, select, insert
+
+from models import db, Message, Conversation, User
+
+# Characters of the last message included in each conversation-list entry
+PREVIEW_LENGTH = 120
+
+
+def _touch(user_id, peer_id, message, unread_delta):
+    """Point one side of a thread at message, adding unread_delta to its unread count"""
+    values = {
+        Conversation.last_message_id: message.id,
+        Conversation.last_timestamp: message.timestamp,
+        Conversation.unread_count: Conversation.unread_count + unread_delta,
+    }
+    updated = Conversation.query.filter_by(user_id=user_id, peer_id=peer_id) \
+        .update(values, synchronize_session=False)
+    if not updated:
+        db.session.add(Conversation(user_id=user_id, peer_id=peer_id, last_message_id=message.id,
+                                    last_timestamp=message.timestamp, unread_count=unread_delta))
+        db.session.flush()
+
+
+def record_message(message):
+    """Update both sides of the thread for a new direct message (flushes it for its id)"""
+    if message.message_type != 'direct' or not str(message.receiver_id).isdigit():
+        return
+    db.session.flush()
+    sender_id, receiver_id = int(message.sender_id), int(message.receiver_id)
+    if sender_id == receiver_id:
+        _touch(sender_id, receiver_id, message, 0)
+        return
+    _touch(sender_id, receiver_id, message, 0)
+    _touch(receiver_id, sender_id, message, 1)
+
+
+def mark_read(user_id, peer_id, up_to_id=None):
+    """Mark peer's messages to user read, up to and including up_to_id (all if None)
+
+    Returns the conversation's remaining unread count.
+    """
+    query = Message.query.filter(Message.sender_id == peer_id, Message.receiver_id == user_id,
+                                 Message.is_read.isnot(True))
+    if up_to_id is not None:
+        query = query.filter(Message.id <= up_to_id)
+    changed = query.update({Message.is_read: True}, synchronize_session=False)
+
+    if changed:
+        remaining = case((Conversation.unread_count > changed, Conversation.unread_count - changed), else_=0)
+        Conversation.query.filter_by(user_id=user_id, peer_id=peer_id) \
+            .update({Conversation.unread_count: remaining}, synchronize_session=False)
+
+    conversation = db.session.get(Conversation, (user_id, peer_id))
+    if conversation is not None:
+        db.session.refresh(conversation)
+        return conversation.unread_count
+    return 0
+
+
+def unread_counts(user_id):
+    """{peer_id: unread} for the user's threads with unread messages"""
+    rows = db.session.query(Conversation.peer_id, Conversation.unread_count) \
+        .filter(Conversation.user_id == user_id, Conversation.unread_count > 0)
+    return dict(rows)
+
+
+def conversation_page(user_id, limit, before_id=None):
+    """The user's threads, most recent first: a page of at most limit dicts
+
+    One indexed query on (user_id, last_message_id) joined to the peer and
+    the last message; pass the last entry's last_message.id as before_id for
+    the next page.
+    """
+    query = db.session.query(
+        Conversation.peer_id, User.name, User.role, User.profile_picture, Conversation.unread_count,
+        Message.id, Message.sender_id, func.substr(Message.content, 1, PREVIEW_LENGTH), Message.timestamp
+    ).join(User, User.id == Conversation.peer_id) \
+        .join(Message, Message.id == Conversation.last_message_id) \
+        .filter(Conversation.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(Conversation.last_message_id < before_id)
+    rows = query.order_by(Conversation.last_message_id.desc()).limit(limit).all()
+
+    return [{
+        'peer_id': peer_id,
+        'peer_name': name,
+        'peer_role': role,
+        'peer_profile_picture': picture,
+        'unread_count': unread,
+        'last_message': {'id': message_id, 'sender_id': sender_id, 'preview': preview, 'timestamp': timestamp},
+    } for peer_id, name, role, picture, unread, message_id, sender_id, preview, timestamp in rows]
+
+
+def rebuild_conversations():
+    """Recompute every Conversation row from messages; returns how many there are
+
+    One pass over messages: each direct message is expanded into the
+    sender's and the receiver's side, and a window function picks the
+    latest message per (user, peer) alongside the unread count.
+    """
+    direct = (Message.message_type == 'direct') & Message.receiver_id.isnot(None)
+    unread = case((Message.is_read.is_(True), 0), else_=1)
+    sides = select(
+        Message.sender_id.label('user_id'), Message.receiver_id.label('peer_id'),
+        Message.id.label('message_id'), Message.timestamp.label('timestamp'), literal(0).label('unread')
+    ).where(direct).union_all(
+        select(Message.receiver_id, Message.sender_id, Message.id, Message.timestamp, unread)
+        .where(direct, Message.receiver_id != Message.sender_id)
+    ).subquery()
+
+    partition = (sides.c.user_id, sides.c.peer_id)
+    ranked = select(
+        sides.c.user_id, sides.c.peer_id, sides.c.message_id, sides.c.timestamp,
+        func.sum(sides.c.unread).over(partition_by=partition).label('unread'),
+        func.row_number().over(partition_by=partition, order_by=sides.c.message_id.desc()).label('rank')
+    ).subquery()
+    latest = select(ranked.c.user_id, ranked.c.peer_id, ranked.c.message_id, ranked.c.timestamp, ranked.c.unread) \
+        .where(ranked.c.rank == 1)
+
+    Conversation.query.delete()
+    return db.session.execute(insert(Conversation).from_select(
+        ['user_id', 'peer_id', 'last_message_id', 'last_timestamp', 'unread_count'], latest
+    )).rowcount
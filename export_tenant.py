@@ -0,0 +1,78 @@
+"""
+Copy one organization's data into its own database
+
+Rows are selected table by table in dependency order. A table with an
+organization_id column contributes that organization's rows. The
+organizations table contributes the organization itself. Any other table
+contributes the rows that reference a row already selected, through one of
+its foreign keys (enrollments of its classrooms, messages of its users,
+...). Ids are kept, so existing tokens, links and cursors stay valid.
+
+The main database is only read. Once TENANT_DATABASES points the
+organization at the new database, requests no longer read its rows from
+the main database, and they can be deleted at leisure. The main users
+table is still needed as the login directory.
+
+Usage: python export_tenant.py ORG_ID DATABASE_URL [--batch-size N]
+       python export_tenant.py 5 sqlite:///tenants/org_5.db
+"""
+import argparse
+
+from sqlalchemy import create_engine, or_, select
+
+
+def _selection(table, selected, org_id):
+    """WHERE clause picking org_id's rows of table, or None if it has nothing of the organization's"""
+    if table.name == 'organizations':
+        return table.c.id == org_id
+    if 'organization_id' in table.c:
+        return table.c.organization_id == org_id
+    references = [
+        column.in_(selected[fk.column.table.name])
+        for column in table.c for fk in column.foreign_keys
+        if fk.column.table.name in selected and fk.column.name == 'id'
+    ]
+    return or_(*references) if references else None
+
+
+def export_tenant(org_id, url, batch_size=1000):
+    """Copy org_id's rows from the main database into url; returns {table name: rows copied}"""
+    from models import db
+
+    target = create_engine(url)
+    db.metadata.create_all(target)  # Also creates the search indexes, which the triggers then fill
+
+    copied, selected = {}, {}
+    with db.engine.connect() as source, target.begin() as destination:
+        if destination.execute(select(db.metadata.tables['organizations'].c.id)).first():
+            raise ValueError(f'{url} already holds an organization')
+
+        for table in db.metadata.sorted_tables:
+            where = _selection(table, selected, org_id)
+            if where is None:
+                continue
+            if 'id' in table.c:
+                selected[table.name] = select(table.c.id).where(where)
+
+            copied[table.name] = 0
+            rows = source.execution_options(yield_per=batch_size).execute(select(table).where(where))
+            for batch in rows.mappings().partitions():
+                destination.execute(table.insert(), [dict(row) for row in batch])
+                copied[table.name] += len(batch)
+    return copied
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copy an organization's data into its own database")
+    parser.add_argument('org_id', type=int)
+    parser.add_argument('url', help='e.g. sqlite:///tenants/org_5.db')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        counts = export_tenant(args.org_id, args.url, args.batch_size)
+    for name, count in counts.items():
+        print(f'{name:<24}{count:>10,}')
+    print(f"\nNow add it to TENANT_DATABASES, e.g. TENANT_DATABASES='{{\"{args.org_id}\": \"{args.url}\"}}'")
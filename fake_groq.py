@@ -0,0 +1,40 @@
+"""
+Offline stand-in for the Groq client
+
+Implements the part of the SDK the chatbot uses
+(client.chat.completions.create) so cache hit rates and latency can be
+measured without network access or an API key.
+
+Set GROQ_FAKE=1 (and optionally GROQ_FAKE_LATENCY=<seconds>) to make
+chatbot.py use it instead of the real client.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeGroq:
+    """Answers every prompt after a fixed delay and counts upstream calls"""
+
+    def __init__(self, latency=0.5, reply='This is an offline test reply.'):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        content = f"{self.reply} (you asked: {messages[-1]['content']})"
+        if stream:
+            return self._stream(content)
+        time.sleep(self.latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _stream(self, content):
+        """Yield chunks shaped like Groq's, spreading the latency across tokens"""
+        tokens = [word + ' ' for word in content.split()]
+        for token in tokens:
+            time.sleep(self.latency / len(tokens))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
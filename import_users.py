@@ -1,99 +1,155 @@
 """
 Import users from users_data.csv into the database
+
+The CSV is streamed in batches. Passwords are hashed in a process pool
+across all cores, and each batch is upserted by email with bulk INSERT /
+UPDATE statements, so re-running the import updates existing users (and
+keeps their ids) instead of deleting everyone first.
+
+Usage: python import_users.py [csv_path] [--batch-size N] [--workers N] [--quiet]
 """
+import argparse
 import csv
-from app import app
-from models import db, User
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import bcrypt as bcrypt_lib
+
+ROLE_HEADINGS = [
+    ('admin', '📌 ADMIN USERS:'),
+    ('staff', '👨‍🏫 STAFF USERS:'),
+    ('teacher', '👨‍🏫 TEACHER USERS:'),
+    ('student', '🎓 STUDENT USERS:'),
+]
+
+
+def _hash_password(args):
+    """Hash one password exactly like models.bcrypt does (runs in a worker process)"""
+    password, rounds, prefix, handle_long_passwords = args
+    password = password.encode('utf-8')
+    if handle_long_passwords:
+        password = hashlib.sha256(password).hexdigest().encode('utf-8')
+    salt = bcrypt_lib.gensalt(rounds=rounds, prefix=prefix.encode('utf-8'))
+    return bcrypt_lib.hashpw(password, salt).decode('utf-8')
+
+
+def _read_batches(path, batch_size):
+    """Yield lists of normalized rows without loading the whole file"""
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                return
+            # Last row wins if an email appears twice in one batch
+            rows = {}
+            for row in batch:
+                email = row['email'].strip().lower()
+                rows[email] = {
+                    'name': f"{row['first_name']} {row['last_name']}",
+                    'email': email,
+                    'role': row['role'].lower(),  # Convert Admin/Staff/Student to lowercase
+                    'password': row['password']
+                }
+            yield list(rows.values())
+
+
+def _upsert_batch(rows, hashes):
+    """Insert new users and update existing ones (matched by email) in bulk"""
+    from sqlalchemy import insert, update
+    from models import db, User
+
+    existing = dict(db.session.query(User.email, User.id).filter(User.email.in_([r['email'] for r in rows])))
+    inserts, updates = [], []
+    for row, password_hash in zip(rows, hashes):
+        values = {'name': row['name'], 'email': row['email'], 'role': row['role'], 'password_hash': password_hash}
+        if row['email'] in existing:
+            updates.append(dict(values, id=existing[row['email']]))
+        else:
+            inserts.append(values)
+
+    if inserts:
+        db.session.execute(insert(User), inserts)
+    if updates:
+        db.session.execute(update(User), updates)
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def _print_credentials(credentials):
+    print('\n' + '='*80)
+    print('LOGIN CREDENTIALS')
+    print('='*80)
+
+    headings = dict(ROLE_HEADINGS)
+    roles = [r for r, _ in ROLE_HEADINGS] + sorted({c['role'] for c in credentials} - set(headings))
+    for role in roles:
+        users = [c for c in credentials if c['role'] == role]
+        if not users:
+            continue
+        print(f"\n{headings.get(role, role.upper() + ' USERS:')}")
+        print('-' * 80)
+        for user in users:
+            print(f"  Email: {user['email']:40} | Password: {user['password']:20} | Name: {user['name']}")
+
+    print('\n' + '='*80)
+
+
+def import_users_from_csv(path='users_data.csv', batch_size=500, workers=None, show_credentials=True):
+    """Import users from a CSV file"""
+    from app import app
 
-def import_users_from_csv():
-    """Import users from users_data.csv file"""
     with app.app_context():
-        # Clear existing users
-        print('Clearing existing users...')
-        User.query.delete()
-        db.session.commit()
-        
-        # Read CSV file
-        print('Reading users_data.csv...')
-        with open('users_data.csv', 'r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            users_added = 0
-            
-            for row in csv_reader:
-                # Create new user
-                user = User(
-                    name=f"{row['first_name']} {row['last_name']}",
-                    email=row['email'].strip().lower(),
-                    role=row['role'].lower()  # Convert Admin/Staff/Student to lowercase
-                )
-                
-                # Set password from CSV
-                user.set_password(row['password'])
-                
-                db.session.add(user)
-                users_added += 1
-                print(f"Added user: {user.name} ({user.email}) - Role: {user.role} - Password: {row['password']}")
-            
-            # Commit all changes
-            db.session.commit()
-            print(f'\n✓ Successfully imported {users_added} users!')
-            print('\n' + '='*80)
-            print('LOGIN CREDENTIALS')
-            print('='*80)
-            
-            # Display all users with credentials
-            all_users = User.query.all()
-            
-            # Group by role
-            admins = [u for u in all_users if u.role == 'admin']
-            staff = [u for u in all_users if u.role == 'staff']
-            students = [u for u in all_users if u.role == 'student']
-            
-            if admins:
-                print('\n📌 ADMIN USERS:')
-                print('-' * 80)
-                for user in admins:
-                    # Get password from CSV again for display
-                    with open('users_data.csv', 'r', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for r in reader:
-                            if r['email'].strip().lower() == user.email:
-                                print(f"  Email: {user.email:40} | Password: {r['password']:20} | Name: {user.name}")
-                                break
-            
-            if staff:
-                print('\n👨‍🏫 STAFF USERS:')
-                print('-' * 80)
-                for user in staff:
-                    with open('users_data.csv', 'r', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for r in reader:
-                            if r['email'].strip().lower() == user.email:
-                                print(f"  Email: {user.email:40} | Password: {r['password']:20} | Name: {user.name}")
-                                break
-            
-            if students:
-                print('\n🎓 STUDENT USERS:')
-                print('-' * 80)
-                for user in students:
-                    with open('users_data.csv', 'r', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for r in reader:
-                            if r['email'].strip().lower() == user.email:
-                                print(f"  Email: {user.email:40} | Password: {r['password']:20} | Name: {user.name}")
-                                break
-            
-            print('\n' + '='*80)
-            
-            # Display first 5 users
-            sample_users = User.query.limit(5).all()
-            for user in sample_users:
-                print(f"  - Email: {user.email} | Name: {user.name} | Role: {user.role}")
+        hash_settings = (
+            app.config.get('BCRYPT_LOG_ROUNDS', 12),
+            app.config.get('BCRYPT_HASH_PREFIX', '2b'),
+            app.config.get('BCRYPT_HANDLE_LONG_PASSWORDS', False)
+        )
+        workers = workers or os.cpu_count() or 1
+        print(f'Importing {path} in batches of {batch_size} with {workers} hashing workers...')
+
+        created = updated = 0
+        credentials = []
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in _read_batches(path, batch_size):
+                hashes = list(pool.map(_hash_password, [(r['password'],) + hash_settings for r in rows],
+                                       chunksize=max(1, len(rows) // (workers * 4))))
+                batch_created, batch_updated = _upsert_batch(rows, hashes)
+                created += batch_created
+                updated += batch_updated
+                if show_credentials:
+                    credentials.extend(rows)
+
+                done = created + updated
+                print(f'  {done:,} users ({done / (time.perf_counter() - started):,.0f} users/s)')
+
+        elapsed = time.perf_counter() - started
+        total = created + updated
+        print(f'\n✓ Imported {total:,} users ({created:,} new, {updated:,} updated) '
+              f'in {elapsed:.1f}s - {total / elapsed if elapsed else 0:,.0f} users/s')
+
+        if show_credentials:
+            _print_credentials(credentials)
+
+        return created, updated
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import users from a CSV file')
+    parser.add_argument('csv_path', nargs='?', default='users_data.csv')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=None, help='hashing processes (default: all cores)')
+    parser.add_argument('--quiet', action='store_true', help="don't print the credentials table")
+    args = parser.parse_args()
+
     try:
-        import_users_from_csv()
+        import_users_from_csv(args.csv_path, args.batch_size, args.workers, not args.quiet)
     except FileNotFoundError:
-        print('Error: user_id.csv file not found!')
+        print(f'Error: {args.csv_path} file not found!')
     except Exception as e:
         print(f'Error importing users: {str(e)}')
@@ -0,0 +1,60 @@
+"""
+JSON provider for app.json / jsonify
+
+Uses orjson when it is installed and the stdlib json module otherwise.
+Both encode datetimes and dates as ISO 8601 strings (the same text as
+.isoformat()), so endpoints can hand raw column values to jsonify instead
+of formatting every timestamp in Python.
+
+Set JSON_PROVIDER=stdlib to force the fallback.
+"""
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional - stdlib json without it
+    orjson = None
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's default provider, but with ISO 8601 dates and without key sorting"""
+
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """orjson-backed provider; falls back to the stdlib for options orjson can't honour"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Skip the bytes -> str -> bytes round trip; pretty-print in debug like Flask does
+        if self.compact is False or (self.compact is None and self._app.debug):
+            body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+        else:
+            body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the fastest available provider (or the one named by JSON_PROVIDER)"""
+    name = app.config.get('JSON_PROVIDER') or ('orjson' if orjson else 'stdlib')
+    app.json = OrjsonProvider(app) if name == 'orjson' and orjson else StdlibJSONProvider(app)
+    return app.json
@@ -0,0 +1,65 @@
+"""
+In-process notification hub for new messages
+
+send_message publishes every new Message here, and /api/messages/stream
+blocks on the hub instead of querying the database on a timer.
+
+Messages are tagged with the database they were saved in (None for the
+main one), since organizations with their own database reuse message and
+user ids, and with the sender's organization, since broadcasts only reach
+that organization.
+"""
+import threading
+from collections import deque
+
+
+class MessageHub:
+    """Fan out newly created messages to waiting stream connections"""
+
+    def __init__(self, history=1000):
+        self._condition = threading.Condition()
+        self._recent = deque(maxlen=history)  # (seq, database, organization_id, message dict)
+        self._seq = 0
+
+    @property
+    def current_seq(self):
+        """Sequence number of the latest published message"""
+        with self._condition:
+            return self._seq
+
+    def publish(self, message, database=None, organization_id=None):
+        """Store a serialized message and wake every waiting stream"""
+        with self._condition:
+            self._seq += 1
+            self._recent.append((self._seq, database, organization_id, message))
+            self._condition.notify_all()
+
+    def wait(self, after_seq, timeout, database=None, organization_id=None):
+        """Block until something is published after after_seq, or timeout
+
+        Only messages saved in database are returned, and with an
+        organization_id only that organization's broadcasts.
+
+        Returns (seq, messages, complete). complete is False when the hub no
+        longer holds everything since after_seq, so the caller should catch
+        up from the database instead.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after_seq, timeout)
+            complete = not self._recent or self._recent[0][0] <= after_seq + 1
+            messages = [
+                m for seq, db, org, m in self._recent
+                if seq > after_seq and db == database and
+                (organization_id is None or org == organization_id or m['message_type'] != 'broadcast')
+            ]
+            return self._seq, messages, complete
+
+
+def is_visible_to(message, user_id):
+    """Whether a serialized message belongs in user_id's feed"""
+    return (message['message_type'] == 'broadcast' or
+            message['sender_id'] == user_id or
+            message['receiver_id'] == user_id)
+
+
+message_hub = MessageHub()
@@ -1,9 +1,13 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from sqlalchemy.orm import joinedload, raiseload, aliased
+
+from tenancy import TenantSession
 
 # Create instances that will be initialized by app
-db = SQLAlchemy()
+# (TenantSession routes organizations with their own database - see tenancy.py)
+db = SQLAlchemy(session_options={'class_': TenantSession})
 bcrypt = Bcrypt()
 
 class Organization(db.Model):
@@ -31,6 +35,16 @@ class User(db.Model):
     profile_picture = db.Column(db.String(500), default='https://lh3.googleusercontent.com/aida-public/AB6AXuDJ7alwZ4VtU9QjSG7VKafpieuWwNgPDgp2Y4KxAjlKwzhLF9QwtgPuE_RxEueIXjzAiJU3DrN2mg8myDX5Rfxgw2ifFs1p5OCij9LY2ZGhTKIh0kYMHHC3Mtg1ufz4cR_l1c73jMMIalIAWIrN_SQWZVBn-C9kHQB0yE-qHi9Fo1cK2mGRyJk9nbq4IFvGPJGk4WnaxiN08atgc4Ee_rrBwEKGkl90Fub5d2GJsgmGbs3F0VpIEi4oxFCGFJO761a2Q4R5x811WzyZ')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # The directory is ordered by (lower(name), id): these expression indexes
+    # serve name-prefix search and keyset pages, overall and per organization
+    # (the latter also covers plain organization_id lookups). lower(email)
+    # serves case-insensitive email-prefix search.
+    __table_args__ = (
+        db.Index('ix_users_name_lower', db.func.lower(name), id),
+        db.Index('ix_users_org_name_lower', organization_id, db.func.lower(name), id),
+        db.Index('ix_users_email_lower', db.func.lower(email)),
+    )
+    
     def set_password(self, password):
         """Hash and set password"""
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
@@ -39,30 +53,41 @@ class User(db.Model):
         """Check if provided password matches hash"""
         return bcrypt.check_password_hash(self.password_hash, password)
     
+    ROW_FIELDS = ('id', 'organization_id', 'name', 'email', 'role', 'profile_picture', 'created_at')
+    # Enough for recipient pickers - no email or 500-character picture URL
+    COMPACT_FIELDS = ('id', 'name', 'role')
+    
+    @classmethod
+    def row_query(cls, fields=None):
+        """Just the to_dict() columns (or the given fields) as plain rows - no ORM objects are built"""
+        return db.session.query(*(getattr(cls, f) for f in fields or cls.ROW_FIELDS))
+    
+    @classmethod
+    def row_dict(cls, row, fields=None):
+        """to_dict() for a row_query() row; created_at stays a datetime for the JSON provider"""
+        return dict(zip(fields or cls.ROW_FIELDS, row))
+    
     def to_dict(self):
-        """Convert user object to dictionary"""
-        return {
-            'id': self.id,
-            'organization_id': self.organization_id,
-            'name': self.name,
-            'email': self.email,
-            'role': self.role,
-            'profile_picture': self.profile_picture,
-            'created_at': self.created_at.isoformat()
-        }
+        """Convert user object to dictionary (also used by user_cache.UserSnapshot)"""
+        data = User.row_dict([getattr(self, f) for f in User.ROW_FIELDS])
+        data['created_at'] = self.created_at.isoformat()
+        return data
     
     def __repr__(self):
         return f'<User {self.email}>'
 
 class Event(db.Model):
     __tablename__ = 'events'
+    __table_args__ = (
+        db.Index('ix_events_org_date', 'organization_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)
     organizer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    date = db.Column(db.DateTime, nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
     location = db.Column(db.String(200))
     image_url = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -82,10 +107,13 @@ class Event(db.Model):
 
 class EventRegistration(db.Model):
     __tablename__ = 'event_registrations'
+    __table_args__ = (
+        db.Index('ix_event_registrations_event_user', 'event_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='registered') # registered, attended, cancelled
     phone = db.Column(db.String(20))
     dietary_requirements = db.Column(db.Text)
@@ -94,6 +122,9 @@ class EventRegistration(db.Model):
 
 class Announcement(db.Model):
     __tablename__ = 'announcements'
+    __table_args__ = (
+        db.Index('ix_announcements_org_created', 'organization_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)
@@ -101,7 +132,7 @@ class Announcement(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     priority = db.Column(db.String(20), default='normal') # normal, high, urgent
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
@@ -117,8 +148,8 @@ class Classroom(db.Model):
     __tablename__ = 'classrooms'
     
     id = db.Column(db.Integer, primary_key=True)
-    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True, index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     code = db.Column(db.String(20), unique=True, nullable=False)
     description = db.Column(db.Text)
@@ -130,6 +161,11 @@ class Classroom(db.Model):
     enrollments = db.relationship('Enrollment', backref='classroom', lazy=True)
     attendance_records = db.relationship('Attendance', backref='classroom', lazy=True)
 
+    @classmethod
+    def list_query(cls):
+        """Query for list endpoints - loads the teacher up front and never lazy-loads"""
+        return cls.query.options(joinedload(cls.teacher), raiseload('*'))
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -144,7 +180,7 @@ class Material(db.Model):
     __tablename__ = 'materials'
     
     id = db.Column(db.Integer, primary_key=True)
-    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     file_url = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50))
@@ -160,11 +196,37 @@ class Material(db.Model):
             'uploaded_at': self.uploaded_at.isoformat()
         }
 
+class UploadSession(db.Model):
+    """A resumable material upload in progress (see storage.py)"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False, default=0)
+    material_id = db.Column(db.Integer, db.ForeignKey('materials.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # For expiring abandoned uploads
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'classroom_id': self.classroom_id,
+            'filename': self.filename,
+            'title': self.title,
+            'size': self.size,
+            'offset': self.offset,
+            'complete': self.material_id is not None,
+            'material_id': self.material_id
+        }
+
 class Assignment(db.Model):
     __tablename__ = 'assignments'
     
     id = db.Column(db.Integer, primary_key=True)
-    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     due_date = db.Column(db.DateTime)
@@ -182,6 +244,10 @@ class Assignment(db.Model):
 
 class Enrollment(db.Model):
     __tablename__ = 'enrollments'
+    __table_args__ = (
+        db.Index('ix_enrollments_user_classroom', 'user_id', 'classroom_id'),
+        db.Index('ix_enrollments_classroom', 'classroom_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -190,6 +256,11 @@ class Enrollment(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        db.Index('ix_attendance_user_status', 'user_id', 'status'),
+        # One row per student per class per day; also serves per-class roster lookups
+        db.Index('ix_attendance_classroom_date_user', 'classroom_id', 'date', 'user_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), nullable=False)
@@ -198,8 +269,23 @@ class Attendance(db.Model):
     status = db.Column(db.String(20), nullable=False) # present, absent, late, excused
     recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class AttendanceSummary(db.Model):
+    """Running attendance totals per student and classroom (see attendance.py)"""
+    __tablename__ = 'attendance_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), primary_key=True, index=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    excused = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -207,8 +293,53 @@ class ChatMessage(db.Model):
     response = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Notification(db.Model):
+    """Something a user should know about (see notifications.py)"""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_user_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # event, announcement, assignment, message
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False, default='')
+    link = db.Column(db.String(500))
+    is_read = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    ICONS = {'event': 'fa-calendar', 'announcement': 'fa-bullhorn', 'assignment': 'fa-file-alt', 'message': 'fa-envelope'}
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'title': self.title,
+            'message': self.message,
+            'link': self.link,
+            'timestamp': self.created_at.isoformat(),
+            'read': self.is_read,
+            'icon': self.ICONS.get(self.type, 'fa-bell')
+        }
+
+class NotificationCounter(db.Model):
+    """Unread notification count per user, kept in step by notifications.py"""
+    __tablename__ = 'notification_counters'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
 class Message(db.Model):
     __tablename__ = 'messages'
+    # Each branch of the "sender OR receiver OR broadcast" filter gets its own
+    # index, ending in id so keyset pages (id > N / id < N) stay index-only
+    __table_args__ = (
+        db.Index('ix_messages_sender_id', 'sender_id', 'id'),
+        db.Index('ix_messages_receiver_id', 'receiver_id', 'id'),
+        db.Index('ix_messages_type_id', 'message_type', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -221,6 +352,37 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+    @classmethod
+    def list_query(cls):
+        """Query for list endpoints - loads sender and receiver up front and never lazy-loads"""
+        return cls.query.options(joinedload(cls.sender), joinedload(cls.receiver), raiseload('*'))
+
+    @classmethod
+    def row_query(cls):
+        """Rows of (id, sender_id, sender name, receiver_id, receiver name, content,
+        message_type, is_read, timestamp) - no ORM objects are built"""
+        sender, receiver = aliased(User), aliased(User)
+        return db.session.query(
+            cls.id, cls.sender_id, sender.name, cls.receiver_id, receiver.name,
+            cls.content, cls.message_type, cls.is_read, cls.timestamp
+        ).outerjoin(sender, cls.sender_id == sender.id).outerjoin(receiver, cls.receiver_id == receiver.id)
+
+    @staticmethod
+    def row_dict(row):
+        """to_dict() for a row_query() row; timestamp stays a datetime for the JSON provider"""
+        id, sender_id, sender_name, receiver_id, receiver_name, content, message_type, is_read, timestamp = row
+        return {
+            'id': id,
+            'sender_id': sender_id,
+            'sender_name': sender_name or 'Unknown',
+            'receiver_id': receiver_id,
+            'receiver_name': receiver_name or ('All Users' if message_type == 'broadcast' else 'Unknown'),
+            'content': content,
+            'message_type': message_type,
+            'is_read': is_read,
+            'timestamp': timestamp
+        }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -234,10 +396,28 @@ class Message(db.Model):
             'timestamp': self.timestamp.isoformat()
         }
 
+class Conversation(db.Model):
+    """One user's side of a direct-message thread with a peer (see conversations.py)"""
+    __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_user_last', 'user_id', 'last_message_id'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    peer_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_posts_org_timestamp_id', 'organization_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)  # The author's
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(500))
@@ -247,6 +427,11 @@ class Post(db.Model):
     
     author = db.relationship('User', backref='posts', lazy=True)
 
+    @classmethod
+    def list_query(cls):
+        """Query for list endpoints - loads the author up front and never lazy-loads"""
+        return cls.query.options(joinedload(cls.author), raiseload('*'))
+
     def to_dict(self):
         return {
             'id': self.id,
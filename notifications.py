@@ -0,0 +1,104 @@
+"""
+Notification fan-out and unread counters
+
+Creating an event, announcement, assignment or message inserts one
+Notification per recipient with a single INSERT ... SELECT, and bumps each
+recipient's NotificationCounter in the same transaction. Reading the badge
+count is then a primary-key lookup, and polling for new notifications
+walks the (user_id, id) index - neither scans anything.
+
+All functions leave committing to the caller.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert, literal, func
+
+from models import db, User, Enrollment, Notification, NotificationCounter
+
+
+def org_audience(organization_id, exclude_user_id=None):
+    """Ids of everyone in an organization (everyone without one if it is None)"""
+    # Never the whole install: a creator without an organization only reaches the unaffiliated
+    query = select(User.id).where(User.organization_id.is_(None) if organization_id is None
+                                  else User.organization_id == organization_id)
+    if exclude_user_id is not None:
+        query = query.where(User.id != exclude_user_id)
+    return query
+
+
+def classroom_audience(classroom_id):
+    """Ids of the students enrolled in a classroom"""
+    return select(Enrollment.user_id).where(Enrollment.classroom_id == classroom_id)
+
+
+def _bump_counters(audience, delta):
+    """Add delta to the unread counter of every user id in audience"""
+    db.session.execute(
+        NotificationCounter.__table__.update()
+        .where(NotificationCounter.user_id.in_(audience))
+        .values(unread=NotificationCounter.unread + delta)
+    )
+    recipients = audience.subquery()
+    missing = select(recipients.c[0], literal(delta)) \
+        .where(recipients.c[0].not_in(select(NotificationCounter.user_id)))
+    db.session.execute(insert(NotificationCounter).from_select(['user_id', 'unread'], missing))
+
+
+def notify(audience, type, title, message='', link=None):
+    """Create a notification for every user id selected by audience
+
+    audience is a SELECT of user ids (see org_audience / classroom_audience)
+    or a list of ids. Returns how many notifications were created.
+    """
+    if isinstance(audience, (list, tuple, set)):
+        user_ids = [int(u) for u in audience if str(u).isdigit()]
+        if not user_ids:
+            return 0
+        audience = select(User.id).where(User.id.in_(user_ids))
+
+    recipients = audience.subquery()
+    rows = select(
+        recipients.c[0], literal(type), literal(title), literal(message or ''), literal(link),
+        literal(False), literal(datetime.utcnow())
+    )
+    result = db.session.execute(insert(Notification).from_select(
+        ['user_id', 'type', 'title', 'message', 'link', 'is_read', 'created_at'], rows
+    ))
+    if result.rowcount:
+        _bump_counters(audience, 1)
+    return result.rowcount
+
+
+def unread_count(user_id):
+    """The user's unread count - one primary-key lookup"""
+    counter = db.session.get(NotificationCounter, user_id)
+    return counter.unread if counter else 0
+
+
+def mark_read(user_id, notification_id):
+    """Mark one of the user's notifications read; returns False if it isn't theirs"""
+    # Conditional UPDATE, so two concurrent reads can't both decrement the counter
+    changed = Notification.query.filter_by(id=notification_id, user_id=user_id, is_read=False) \
+        .update({Notification.is_read: True}, synchronize_session=False)
+    if changed:
+        NotificationCounter.query.filter(NotificationCounter.user_id == user_id, NotificationCounter.unread > 0) \
+            .update({NotificationCounter.unread: NotificationCounter.unread - 1}, synchronize_session=False)
+        return True
+    return Notification.query.filter_by(id=notification_id, user_id=user_id).count() > 0
+
+
+def mark_all_read(user_id):
+    """Mark all of the user's notifications read; returns how many changed"""
+    changed = Notification.query.filter_by(user_id=user_id, is_read=False) \
+        .update({Notification.is_read: True}, synchronize_session=False)
+    NotificationCounter.query.filter_by(user_id=user_id) \
+        .update({NotificationCounter.unread: 0}, synchronize_session=False)
+    return changed
+
+
+def rebuild_notification_counters():
+    """Recompute every counter from the notifications table; returns how many users have one"""
+    NotificationCounter.query.delete()
+    unread = select(Notification.user_id, func.count()).where(Notification.is_read.is_(False)) \
+        .group_by(Notification.user_id)
+    return db.session.execute(insert(NotificationCounter).from_select(['user_id', 'unread'], unread)).rowcount
@@ -0,0 +1,29 @@
+"""
+Helpers for cursor-based (keyset) pagination of list endpoints
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+
+
+def parse_limit(default=50, maximum=200):
+    """Read ?limit= from the query string, clamped to 1..maximum"""
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(*values):
+    """Pack keyset values (e.g. a timestamp and an id) into an opaque cursor string"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpack a cursor from encode_cursor, or return None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
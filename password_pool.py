@@ -0,0 +1,140 @@
+"""
+Bounded worker pool for bcrypt work done during login
+
+bcrypt is deliberately slow, so /api/auth/login hands it to a small,
+dedicated thread pool (bcrypt releases the GIL while hashing) instead of
+running it on the request thread. The pool only accepts a limited number of
+pending jobs; when it is full, login fails fast with PoolBusy so a login
+storm can't tie up every web worker and stall the rest of the app.
+
+It also records how long logins wait and hash, so BCRYPT_LOG_ROUNDS can be
+tuned against measured throughput (see /api/auth/login-metrics).
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+HASH_COST = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PoolBusy(Exception):
+    """Raised when too many hash jobs are already waiting (or one waited too long)"""
+
+
+def hash_cost(password_hash):
+    """Return the bcrypt cost factor stored in a hash, or None if it isn't bcrypt"""
+    match = HASH_COST.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+
+
+class PasswordPool:
+    """Size-limited executor with a queue-depth limit and latency metrics"""
+
+    def __init__(self, workers=None, max_pending=None, samples=1000):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._samples = deque(maxlen=samples)  # (wait ms, hash ms)
+        self.stats = {'completed': 0, 'rejected': 0, 'rehashed': 0}
+        self.configure(workers, max_pending)
+
+    def configure(self, workers=None, max_pending=None):
+        """(Re)size the pool; jobs already running finish on the old one"""
+        workers = workers or min(4, os.cpu_count() or 1)
+        with self._lock:
+            old = self._executor
+            self.workers = workers
+            self.max_pending = max_pending or workers * 8
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def init_app(self, app):
+        """Size the pool from LOGIN_HASH_WORKERS / LOGIN_HASH_MAX_PENDING"""
+        self.configure(app.config.get('LOGIN_HASH_WORKERS'), app.config.get('LOGIN_HASH_MAX_PENDING'))
+
+    @property
+    def pending(self):
+        """Jobs queued or running right now"""
+        with self._lock:
+            return self._pending
+
+    def run(self, fn, *args, timeout=None):
+        """Run fn(*args) on the pool and wait for the result
+
+        Raises PoolBusy straight away if max_pending jobs are already queued,
+        or once timeout seconds pass without a result.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise PoolBusy()
+            self._pending += 1
+            executor = self._executor
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self.stats['completed'] += 1
+                    self._samples.append(((started - submitted) * 1000, (finished - started) * 1000))
+
+        try:
+            future = executor.submit(job)
+        except RuntimeError:
+            # Executor was swapped out by configure() between the lock and submit
+            with self._lock:
+                self._pending -= 1
+            raise PoolBusy()
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise PoolBusy()
+
+    def record(self, stat):
+        """Bump a counter such as 'rehashed'"""
+        with self._lock:
+            self.stats[stat] = self.stats.get(stat, 0) + 1
+
+    def metrics(self):
+        """Latency percentiles (ms) over the most recent jobs plus counters"""
+        with self._lock:
+            samples = list(self._samples)
+            stats = dict(self.stats)
+            pending = self._pending
+        waits = [w for w, _ in samples]
+        hashes = [h for _, h in samples]
+        totals = [w + h for w, h in samples]
+        median_hash = _percentile(hashes, 50)
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': pending,
+            **stats,
+            'samples': len(samples),
+            'wait_ms': {'p50': _percentile(waits, 50), 'p95': _percentile(waits, 95)},
+            'hash_ms': {'p50': median_hash, 'p95': _percentile(hashes, 95)},
+            'total_ms': {'p50': _percentile(totals, 50), 'p95': _percentile(totals, 95),
+                         'p99': _percentile(totals, 99)},
+            # Sustainable bcrypt checks per second at the current cost factor
+            'capacity_per_sec': round(self.workers * 1000 / median_hash, 1) if median_hash else None,
+        }
+
+
+login_pool = PasswordPool()
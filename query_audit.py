@@ -0,0 +1,232 @@
+"""
+Query-plan audit - run EXPLAIN QUERY PLAN over the app's real queries
+
+Every request in AUDITED_REQUESTS is sent through the Flask test client
+against a scratch in-memory database, every SQL statement it executes is
+explained, and any plan step that scans a whole table is reported.
+
+Add new endpoints to AUDITED_REQUESTS so they can't silently regress.
+
+Usage: python query_audit.py
+"""
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from pagination import encode_cursor
+from models import (db, User, Organization, Event, EventRegistration, Announcement,
+                    Classroom, Enrollment, Attendance, Message, Post)
+
+# Each entry: method, url, who sends it, optional JSON body and the tables it
+# is allowed to scan (endpoints that intentionally list a whole table).
+# '{classroom_id}', '{event_id}' etc. are filled in from the seeded data.
+AUDITED_REQUESTS = [
+    {'method': 'GET', 'url': '/api/user', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/auth/me', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/users', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/users?q=aud&compact=1', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/users?organization_id={organization_id}&limit=20', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/users?after={user_cursor}', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages?since_id=0&limit=50', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages?before_id={message_id}&limit=50', 'as': 'student'},
+    {'method': 'POST', 'url': '/api/messages', 'as': 'student',
+     'json': {'receiver_id': '{teacher_id}', 'content': 'audit'}},
+    {'method': 'POST', 'url': '/api/messages', 'as': 'admin',
+     'json': {'receiver_id': 'all', 'content': 'audit broadcast'}, 'allow_scan': {'users'}},
+    {'method': 'POST', 'url': '/api/messages/read', 'as': 'student', 'json': {'peer_id': '{teacher_id}'}},
+    {'method': 'GET', 'url': '/api/messages/unread', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages/conversations', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages/conversations?before_id={message_id}', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/messages?peer_id={teacher_id}&since_id=0', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/auth/notifications', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/auth/notifications?count_only=1', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/auth/notifications?since_id=0', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/auth/notifications?unread=1', 'as': 'student'},
+    {'method': 'PUT', 'url': '/api/auth/notifications/read-all', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/search?q=audit', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/search?q=welcome&type=message', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/posts', 'as': None},
+    {'method': 'GET', 'url': '/api/posts?before={post_cursor}', 'as': None},
+    {'method': 'GET', 'url': '/api/posts', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/posts?before={post_cursor}', 'as': 'student'},
+    {'method': 'POST', 'url': '/api/posts', 'as': 'student', 'json': {'content': 'audit'}},
+    {'method': 'GET', 'url': '/api/events', 'as': None},
+    {'method': 'GET', 'url': '/api/events?from=2025-01-01&to=2025-02-01', 'as': None},
+    {'method': 'GET', 'url': '/api/events/summary?month=2025-01', 'as': None},
+    {'method': 'GET', 'url': '/api/events?from=2025-01-01&to=2025-02-01', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/events/summary?month=2025-01', 'as': 'student'},
+    {'method': 'POST', 'url': '/api/events', 'as': 'teacher',
+     'json': {'title': 'Audit Meetup', 'date': '2025-02-01T10:00:00'}},
+    {'method': 'GET', 'url': '/api/events/{event_id}', 'as': None},
+    {'method': 'POST', 'url': '/api/events/{event_id}/register', 'as': 'student', 'json': {}},
+    {'method': 'POST', 'url': '/api/announcements', 'as': 'admin', 'json': {'title': 'Audit', 'content': 'Notice'}},
+    {'method': 'GET', 'url': '/api/announcements', 'as': None},
+    {'method': 'GET', 'url': '/api/announcements', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/classrooms', 'as': 'teacher'},
+    {'method': 'GET', 'url': '/api/classrooms', 'as': 'student'},
+    {'method': 'GET', 'url': '/api/classrooms/{classroom_id}/details', 'as': 'teacher'},
+    {'method': 'POST', 'url': '/api/attendance/mark', 'as': 'teacher',
+     'json': {'classroom_id': '{classroom_id}', 'student_id': '{student_id}',
+              'date': '2025-01-15', 'status': 'present'}},
+    {'method': 'POST', 'url': '/api/attendance/bulk', 'as': 'teacher',
+     'json': {'classroom_id': '{classroom_id}', 'date': '2025-01-16',
+              'records': [{'student_id': '{student_id}', 'status': 'late'}]}},
+    {'method': 'POST', 'url': '/api/classrooms/{classroom_id}/assignments', 'as': 'teacher',
+     'json': {'title': 'Audit homework'}},
+    {'method': 'POST', 'url': '/api/classrooms/{classroom_id}/uploads', 'as': 'teacher',
+     'json': {'filename': 'syllabus.pdf', 'size': 1024}},
+    {'method': 'POST', 'url': '/api/chat', 'as': 'student', 'json': {'message': 'hello'},
+     'allow_scan': {'classrooms'}},
+]
+
+# "SCAN posts" is a full table scan; "SCAN posts USING INDEX ..." walks an
+# index in order and "SCAN CONSTANT ROW" / virtual tables are harmless.
+TABLE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+@contextmanager
+def capture_statements():
+    """Collect (sql, parameters) for every statement executed on the engine"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(statement, parameters):
+    """Return the EXPLAIN QUERY PLAN detail lines for one statement"""
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def table_scans(plan):
+    """Return the tables a plan scans in full"""
+    return [m.group(1) for m in (TABLE_SCAN.match(step) for step in plan) if m]
+
+
+def seed_audit_data():
+    """Create one of everything the audited requests touch"""
+    org = Organization(name='Audit Org', domain='audit.test')
+    db.session.add(org)
+    db.session.flush()
+
+    users = {}
+    for role in ('student', 'teacher', 'admin'):
+        user = User(name=f'Audit {role}', email=f'{role}@audit.test', role=role, organization_id=org.id)
+        user.password_hash = 'x'
+        db.session.add(user)
+        users[role] = user
+    db.session.flush()
+
+    classroom = Classroom(name='Audit 101', code='AUDIT101', teacher_id=users['teacher'].id, organization_id=org.id)
+    event_row = Event(title='Audit Fest', date=datetime.utcnow() + timedelta(days=3),
+                      organizer_id=users['teacher'].id, organization_id=org.id)
+    db.session.add_all([classroom, event_row])
+    db.session.flush()
+
+    post = Post(author_id=users['student'].id, content='first post')
+    message = Message(sender_id=users['teacher'].id, receiver_id=users['student'].id, content='welcome')
+    db.session.add_all([
+        message,
+        Message(sender_id=users['admin'].id, content='hello all', message_type='broadcast'),
+        Enrollment(user_id=users['student'].id, classroom_id=classroom.id),
+        Attendance(classroom_id=classroom.id, user_id=users['student'].id,
+                   date=datetime.utcnow().date(), status='present'),
+        EventRegistration(event_id=event_row.id, user_id=users['admin'].id),
+        Announcement(title='Notice', content='Audit notice', author_id=users['admin'].id, organization_id=org.id),
+        post,
+    ])
+    db.session.commit()
+
+    return users, {
+        'classroom_id': classroom.id,
+        'event_id': event_row.id,
+        'message_id': message.id + 1,
+        'student_id': users['student'].id,
+        'teacher_id': users['teacher'].id,
+        'post_cursor': encode_cursor(post.timestamp, post.id + 1),
+        'organization_id': org.id,
+        'user_cursor': encode_cursor('audit admin', users['admin'].id),
+    }
+
+
+def _fill(value, ids):
+    """Substitute '{name}' placeholders in a URL or JSON body"""
+    if isinstance(value, dict):
+        return {k: _fill(v, ids) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, ids) for v in value]
+    if isinstance(value, str) and re.fullmatch(r'\{(\w+)\}', value):
+        return ids[value[1:-1]]
+    if isinstance(value, str):
+        return value.format(**ids)
+    return value
+
+
+def run_audit(app, requests=None):
+    """Send every audited request and return a list of unexpected table scans
+
+    Must be called inside an app context on a scratch database.
+    """
+    from flask_jwt_extended import create_access_token
+    import chatbot
+
+    users, ids = seed_audit_data()
+    tokens = {role: create_access_token(identity=str(user.id)) for role, user in users.items()}
+    client = app.test_client()
+    findings = []
+
+    # Keep the chatbot offline so the audit never calls the real LLM
+    groq_client, chatbot.client = chatbot.client, None
+    try:
+        for spec in requests or AUDITED_REQUESTS:
+            url = _fill(spec['url'], ids)
+            headers = {'Authorization': f"Bearer {tokens[spec['as']]}"} if spec.get('as') else {}
+
+            with capture_statements() as statements:
+                response = client.open(url, method=spec['method'], headers=headers,
+                                       json=_fill(spec.get('json'), ids))
+            if response.status_code >= 400:
+                findings.append({'request': f"{spec['method']} {url}", 'error': response.status_code})
+
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+                    continue
+                for table in table_scans(explain(statement, parameters)):
+                    if table not in spec.get('allow_scan', ()):
+                        findings.append({'request': f"{spec['method']} {url}", 'table': table, 'sql': statement})
+    finally:
+        chatbot.client = groq_client
+
+    return findings
+
+
+if __name__ == '__main__':
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    from app import app
+
+    with app.app_context():
+        findings = run_audit(app)
+
+    print('\n' + '=' * 80)
+    print('QUERY PLAN AUDIT')
+    print('=' * 80)
+    if not findings:
+        print(f'✅ {len(AUDITED_REQUESTS)} requests audited, no unexpected table scans')
+    for f in findings:
+        if 'error' in f:
+            print(f"❌ {f['request']} failed with status {f['error']}")
+        else:
+            print(f"❌ {f['request']} scans '{f['table']}':\n   {' '.join(f['sql'].split())}")
+    raise SystemExit(1 if findings else 0)
@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import User, db
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, current_user
+from models import User, Notification, db, bcrypt
+from password_pool import login_pool, PoolBusy, hash_cost
+from pagination import parse_limit
+import notifications
+import tenancy
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -42,8 +46,13 @@ def login():
                 'errors': errors
             }), 400
         
+        # The main users table says which organization (and so which database) the user is in
+        directory = db.session.query(User.organization_id).filter_by(email=email).first()
+        if directory is not None:
+            tenancy.activate(directory.organization_id)
+        
         # Find user
-        user = User.query.filter_by(email=email).first()
+        user = User.query.filter_by(email=email).first() if directory is not None else None
         print(f"User found: {user is not None}")  # Debug
         
         if not user:
@@ -52,7 +61,13 @@ def login():
                 'message': 'Invalid email or password'
             }), 401
         
-        password_valid = user.check_password(password)
+        # bcrypt runs on the bounded login pool, not on this request thread
+        timeout = current_app.config.get('LOGIN_HASH_TIMEOUT')
+        try:
+            password_valid = login_pool.run(bcrypt.check_password_hash, user.password_hash, password,
+                                            timeout=timeout)
+        except PoolBusy:
+            return login_busy()
         print(f"Password valid: {password_valid}")  # Debug
         
         if not password_valid:
@@ -61,8 +76,18 @@ def login():
                 'message': 'Invalid email or password'
             }), 401
         
+        # Transparently upgrade hashes made with a different cost factor
+        if hash_cost(user.password_hash) != current_app.config.get('BCRYPT_LOG_ROUNDS', 12):
+            try:
+                new_hash = login_pool.run(bcrypt.generate_password_hash, password, timeout=timeout)
+                user.password_hash = new_hash.decode('utf-8')
+                db.session.commit()
+                login_pool.record('rehashed')
+            except PoolBusy:
+                pass  # Try again on the next login
+        
         # Generate JWT token
-        access_token = create_access_token(identity=str(user.id))
+        access_token = create_access_token(identity=str(user.id), additional_claims={'org': user.organization_id})
         
         return jsonify({
             'success': True,
@@ -80,13 +105,36 @@ def login():
             'message': 'Server error during login'
         }), 500
 
+def login_busy():
+    """503 response telling the client to retry once the login pool drains"""
+    response = jsonify({
+        'success': False,
+        'message': 'Too many login attempts right now, please try again shortly'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '2'
+    return response
+
+@auth_bp.route('/login-metrics', methods=['GET'])
+@jwt_required()
+def get_login_metrics():
+    """Login hashing latency and throughput (admin only)"""
+    user = current_user
+    if not user or user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'bcrypt_rounds': current_app.config.get('BCRYPT_LOG_ROUNDS', 12),
+        'metrics': login_pool.metrics()
+    }), 200
+
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     """Get current authenticated user"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user
         
         if not user:
             return jsonify({
@@ -109,60 +157,43 @@ def get_current_user():
 @auth_bp.route('/notifications', methods=['GET'])
 @jwt_required()
 def get_notifications():
-    """Get user notifications"""
+    """Get user notifications
+
+    ?count_only=1 returns just the unread count (one primary-key lookup).
+    ?since_id=N returns the oldest page of notifications newer than N, for
+    cheap polling; has_more says to ask again from latest_id.
+    ?unread=1 lists unread notifications only.
+    """
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user
         
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
         
-        # Sample notifications (in production, fetch from database)
-        notifications = [
-            {
-                'id': 1,
-                'type': 'event',
-                'title': 'New Event: Tech Fest 2025',
-                'message': 'Annual Tech & Culture Fest is coming up on Jan 15, 2025',
-                'timestamp': '2 hours ago',
-                'read': False,
-                'icon': 'fa-calendar'
-            },
-            {
-                'id': 2,
-                'type': 'assignment',
-                'title': 'Assignment Due',
-                'message': 'Data Structures assignment due in 3 days',
-                'timestamp': '5 hours ago',
-                'read': False,
-                'icon': 'fa-file-alt'
-            },
-            {
-                'id': 3,
-                'type': 'message',
-                'title': 'New Message from Dr. Smith',
-                'message': 'Please check your email for project feedback',
-                'timestamp': '1 day ago',
-                'read': True,
-                'icon': 'fa-envelope'
-            },
-            {
-                'id': 4,
-                'type': 'announcement',
-                'title': 'Campus Update',
-                'message': 'Library hours extended during exam week',
-                'timestamp': '2 days ago',
-                'read': True,
-                'icon': 'fa-bullhorn'
-            }
-        ]
+        unread_count = notifications.unread_count(user.id)
+        if request.args.get('count_only') in ('1', 'true'):
+            return jsonify({'success': True, 'unread_count': unread_count}), 200
         
-        unread_count = sum(1 for n in notifications if not n['read'])
+        limit = parse_limit(default=20, maximum=100)
+        query = Notification.query.filter_by(user_id=user.id)
+        since_id = request.args.get('since_id', type=int)
+        has_more = False
+        if request.args.get('unread') in ('1', 'true'):
+            items = query.filter_by(is_read=False).order_by(Notification.created_at.desc()).limit(limit).all()
+        elif since_id is not None:
+            # Oldest first, so a burst bigger than one page is picked up over several polls
+            items = query.filter(Notification.id > since_id).order_by(Notification.id.asc()).limit(limit + 1).all()
+            has_more = len(items) > limit
+            items = items[:limit][::-1]
+        else:
+            items = query.order_by(Notification.id.desc()).limit(limit).all()
         
         return jsonify({
             'success': True,
-            'notifications': notifications,
-            'unread_count': unread_count
+            'notifications': [n.to_dict() for n in items],
+            'unread_count': unread_count,
+            'latest_id': max([n.id for n in items], default=since_id),
+            'has_more': has_more
         }), 200
         
     except Exception as e:
@@ -174,11 +205,29 @@ def get_notifications():
 def mark_notification_read(notification_id):
     """Mark notification as read"""
     try:
+        user_id = int(get_jwt_identity())
+        if not notifications.mark_read(user_id, notification_id):
+            return jsonify({'success': False, 'message': 'Notification not found'}), 404
+        db.session.commit()
         return jsonify({
             'success': True,
-            'message': 'Notification marked as read'
+            'message': 'Notification marked as read',
+            'unread_count': notifications.unread_count(user_id)
         }), 200
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Server error'}), 500
+
+@auth_bp.route('/notifications/read-all', methods=['PUT'])
+@jwt_required()
+def mark_all_notifications_read():
+    """Mark every notification as read"""
+    try:
+        notifications.mark_all_read(int(get_jwt_identity()))
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'All notifications marked as read', 'unread_count': 0}), 200
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @auth_bp.route('/settings', methods=['GET'])
@@ -186,8 +235,7 @@ def mark_notification_read(notification_id):
 def get_settings():
     """Get user settings"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user
         
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -231,8 +279,7 @@ def get_settings():
 def update_settings():
     """Update user settings"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_user
         
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -1,33 +1,91 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Event, EventRegistration, Announcement, Classroom, Material, Attendance, ChatMessage, Organization, Post, Assignment, Enrollment
-from datetime import datetime
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from models import db, Event, EventRegistration, Announcement, Classroom, Material, Attendance, AttendanceSummary, ChatMessage, Organization, Post, Assignment, Enrollment, UploadSession
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, tuple_
+import hashlib
 import random
 import os
+import threading
+import time
 from werkzeug.utils import secure_filename
+from cache import feed_cache, user_context_cache, shared_context_cache
+from attendance import ATTENDANCE_STATUSES, record_attendance, record_class_attendance
+from pagination import parse_limit, encode_cursor, decode_cursor
+import storage
+import tenancy
+from notifications import notify, org_audience, classroom_audience
+import search
 
 api_bp = Blueprint('api', __name__)
 
 @api_bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_current_user_details():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     return jsonify(user.to_dict()), 200
 
 # --- Posts Endpoints ---
 
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+# Bumped by create_post. Part of the first-page cache key, so a page computed
+# before a new post was committed can never be served after it.
+feed_version = 0
+_feed_version_lock = threading.Lock()
+
+def _bump_feed_version():
+    """+= isn't atomic across threads, and a lost bump would keep serving a stale page"""
+    global feed_version
+    with _feed_version_lock:
+        feed_version += 1
+
+def _feed_page(query, limit):
+    """One page of the feed, newest first, keyset-paginated on (timestamp, id)"""
+    posts = query.order_by(Post.timestamp.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(posts) > limit:
+        last = posts[limit - 1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    return {'success': True, 'posts': [p.to_dict() for p in posts[:limit]], 'next_cursor': next_cursor}
+
 @api_bp.route('/posts', methods=['GET'])
 def get_posts():
-    posts = Post.query.order_by(Post.timestamp.desc()).all()
-    return jsonify({'success': True, 'posts': [p.to_dict() for p in posts]}), 200
+    tenancy.activate_optional()
+    limit = parse_limit(default=FEED_PAGE_SIZE, maximum=FEED_MAX_PAGE_SIZE)
+    posts = tenancy.scoped(Post.list_query(), Post)
+    
+    before = request.args.get('before')
+    if before:
+        cursor = decode_cursor(before)
+        try:
+            timestamp, post_id = datetime.fromisoformat(cursor[0]), int(cursor[1])
+        except (TypeError, ValueError, IndexError):
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+        query = posts.filter(tuple_(Post.timestamp, Post.id) < tuple_(timestamp, post_id))
+        return jsonify(_feed_page(query, limit)), 200
+    
+    # First page: built once per feed version and revalidated with an ETag,
+    # so refreshing an unchanged feed is a 304 with no queries
+    key = tenancy.cache_key((feed_version, tenancy.current_org_id(), limit))
+    cached = feed_cache.get(key)
+    if cached is None:
+        body = current_app.json.dumps(_feed_page(posts, limit))
+        cached = (body, hashlib.md5(body.encode('utf-8')).hexdigest())
+        feed_cache.set(key, cached)
+    
+    body, etag = cached
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Authorization')  # The feed depends on the caller's organization
+    return response.make_conditional(request)
 
 @api_bp.route('/posts', methods=['POST'])
 @jwt_required()
 def create_post():
-    current_user_id = int(get_jwt_identity())
     data = request.get_json()
     
     if not data.get('content'):
@@ -35,33 +93,85 @@ def create_post():
         
     try:
         new_post = Post(
-            author_id=current_user_id,
+            author_id=current_user.id,
+            organization_id=current_user.organization_id,
             content=data['content'],
             image_url=data.get('image_url')
         )
         db.session.add(new_post)
         db.session.commit()
+        _bump_feed_version()
+        
         return jsonify({'success': True, 'post': new_post.to_dict()}), 201
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
 # --- Events Endpoints ---
 
+def _parse_datetime(value):
+    """Parse an ISO date/datetime from the client as naive UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _event_range():
+    """Read ?from=&to= (or ?month=YYYY-MM) as a [start, end) datetime range"""
+    month = request.args.get('month')
+    if month:
+        start = datetime.strptime(month, '%Y-%m')
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return start, end
+    start, end = request.args.get('from'), request.args.get('to')
+    return (_parse_datetime(start) if start else None,
+            _parse_datetime(end) if end else None)
+
+def _filter_event_range(query, start, end):
+    """Events of the current organization (if any) in [start, end)"""
+    query = tenancy.scoped(query, Event)
+    if start:
+        query = query.filter(Event.date >= start)
+    if end:
+        query = query.filter(Event.date < end)
+    return query
+
 @api_bp.route('/events', methods=['GET'])
 def get_events():
-    events = Event.query.order_by(Event.date.desc()).all()
+    tenancy.activate_optional()
+    try:
+        start, end = _event_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range'}), 400
+    
+    events = _filter_event_range(Event.query, start, end).order_by(Event.date.desc()).all()
     return jsonify({'success': True, 'events': [e.to_dict() for e in events]}), 200
 
+@api_bp.route('/events/summary', methods=['GET'])
+def get_events_summary():
+    """Per-day event counts for a month (?month=YYYY-MM) or a ?from=&to= range"""
+    tenancy.activate_optional()
+    try:
+        start, end = _event_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range'}), 400
+    if not start or not end:
+        return jsonify({'success': False, 'message': 'month, or both from and to, are required'}), 400
+    
+    day = func.date(Event.date)
+    rows = _filter_event_range(db.session.query(day, func.count(Event.id)), start, end) \
+        .group_by(day).order_by(day).all()
+    return jsonify({'success': True, 'days': {str(d): count for d, count in rows}}), 200
+
 @api_bp.route('/events/<int:event_id>', methods=['GET'])
 def get_event(event_id):
-    event = Event.query.get_or_404(event_id)
+    tenancy.activate_optional()
+    event = tenancy.scoped(Event.query, Event).filter_by(id=event_id).first_or_404()
     return jsonify({'success': True, 'event': event.to_dict()}), 200
 
 @api_bp.route('/events', methods=['POST'])
 @jwt_required()
 def create_event():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if user.role not in ['teacher', 'admin']:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
@@ -74,11 +184,15 @@ def create_event():
             date=datetime.fromisoformat(data['date'].replace('Z', '+00:00')),
             location=data.get('location', ''),
             image_url=data.get('image_url', ''),
-            organizer_id=current_user_id,
+            organizer_id=user.id,
             organization_id=user.organization_id
         )
         db.session.add(new_event)
+        notify(org_audience(user.organization_id, exclude_user_id=user.id), 'event',
+               f'New Event: {new_event.title}',
+               f"{new_event.title} is coming up on {new_event.date.strftime('%b %d, %Y')}", link='/events')
         db.session.commit()
+        shared_context_cache.clear()
         return jsonify({'success': True, 'event': new_event.to_dict()}), 201
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
@@ -102,20 +216,21 @@ def register_event(event_id):
     )
     db.session.add(registration)
     db.session.commit()
+    user_context_cache.invalidate(tenancy.cache_key(current_user_id))
     return jsonify({'success': True, 'message': 'Registered successfully'}), 201
 
 # --- Announcements Endpoints ---
 
 @api_bp.route('/announcements', methods=['GET'])
 def get_announcements():
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
+    tenancy.activate_optional()
+    announcements = tenancy.scoped(Announcement.query, Announcement).order_by(Announcement.created_at.desc()).all()
     return jsonify({'success': True, 'announcements': [a.to_dict() for a in announcements]}), 200
 
 @api_bp.route('/announcements', methods=['POST'])
 @jwt_required()
 def create_announcement():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if user.role not in ['teacher', 'admin']:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
@@ -125,13 +240,45 @@ def create_announcement():
         title=data['title'],
         content=data['content'],
         priority=data.get('priority', 'normal'),
-        author_id=current_user_id,
+        author_id=user.id,
         organization_id=user.organization_id
     )
     db.session.add(new_announcement)
+    notify(org_audience(user.organization_id, exclude_user_id=user.id), 'announcement',
+           new_announcement.title, new_announcement.content[:200], link='/')
     db.session.commit()
+    shared_context_cache.clear()
     return jsonify({'success': True, 'announcement': new_announcement.to_dict()}), 201
 
+# --- Search Endpoint ---
+
+@api_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_content():
+    """Ranked full-text search over posts, announcements, events and my messages
+    
+    ?q= is the search text, ?type=post,message narrows the sources and
+    ?after=<next_cursor> returns the next page.
+    """
+    if not search.is_available(db.session.connection()):
+        return jsonify({'success': False, 'message': 'Search is not available on this database'}), 501
+    if not request.args.get('q', '').strip():
+        return jsonify({'success': False, 'message': 'q is required'}), 400
+    
+    after = None
+    if request.args.get('after'):
+        after = decode_cursor(request.args['after'])
+        if not isinstance(after, list) or len(after) != 3:
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    
+    types = request.args.get('type')
+    results, next_after = search.search(
+        int(get_jwt_identity()), request.args['q'], types=types.split(',') if types else None,
+        limit=parse_limit(default=20, maximum=50), after=after, org_id=tenancy.current_org_id()
+    )
+    next_cursor = encode_cursor(*next_after) if next_after else None
+    return jsonify({'success': True, 'results': results, 'next_cursor': next_cursor}), 200
+
 # --- Classroom & Materials Endpoints ---
 # (Moved to bottom to avoid duplication)
 
@@ -141,25 +288,67 @@ def create_announcement():
 @api_bp.route('/attendance/mark', methods=['POST'])
 @jwt_required()
 def mark_attendance():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if user.role not in ['teacher', 'admin']:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
-    data = request.get_json()
+    data = request.get_json() or {}
     # Expects: classroom_id, student_id, date, status
+    status = data.get('status')
+    if not isinstance(status, str) or status not in ATTENDANCE_STATUSES:
+        return jsonify({'success': False, 'message': f'Invalid status: {status}'}), 400
     
-    attendance = Attendance(
+    record_attendance(
         classroom_id=data['classroom_id'],
         user_id=data['student_id'],
         date=datetime.fromisoformat(data['date']).date(),
-        status=data['status']
+        status=status
     )
-    db.session.add(attendance)
     db.session.commit()
+    user_context_cache.invalidate(tenancy.cache_key(int(data['student_id'])))
     return jsonify({'success': True, 'message': 'Attendance marked'}), 201
 
+@api_bp.route('/attendance/bulk', methods=['POST'])
+@jwt_required()
+def mark_attendance_bulk():
+    """Mark a whole class for one date in a single transaction
+
+    Expects: classroom_id, date, records: [{student_id, status}, ...]
+    Re-submitting corrects existing rows instead of duplicating them.
+    """
+    user = current_user
+    
+    if user.role not in ['teacher', 'admin']:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+        
+    data = request.get_json() or {}
+    try:
+        classroom_id = int(data['classroom_id'])
+        date = datetime.fromisoformat(data['date']).date()
+        roster = {int(r['student_id']): r['status'] for r in data['records']}
+        if not all(isinstance(s, str) for s in roster.values()):
+            raise TypeError('status must be a string')
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'classroom_id, date and records are required'}), 400
+    
+    invalid = sorted({s for s in roster.values() if s not in ATTENDANCE_STATUSES})
+    if invalid:
+        return jsonify({'success': False, 'message': f"Invalid status: {', '.join(map(str, invalid))}"}), 400
+    if not db.session.get(Classroom, classroom_id):
+        return jsonify({'success': False, 'message': 'Classroom not found'}), 404
+    
+    try:
+        counts = record_class_attendance(classroom_id, date, roster)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    for student_id in roster:
+        user_context_cache.invalidate(tenancy.cache_key(student_id))
+    return jsonify({'success': True, 'message': 'Attendance saved', **counts}), 200
+
 # --- Organization Endpoint ---
 @api_bp.route('/organizations', methods=['POST'])
 def create_organization():
@@ -177,23 +366,21 @@ def create_organization():
 @api_bp.route('/classrooms', methods=['GET'])
 @jwt_required()
 def get_classrooms():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if user.role == 'teacher':
         # Teachers see classrooms they teach
-        classrooms = Classroom.query.filter_by(teacher_id=current_user_id).all()
+        classrooms = Classroom.list_query().filter_by(teacher_id=user.id).all()
     else:
-        # Students see all classrooms for now (or enrolled ones if we implement that strictly)
-        classrooms = Classroom.query.all()
+        # Students see all of their organization's classrooms for now (or enrolled ones if we implement that strictly)
+        classrooms = tenancy.scoped(Classroom.list_query(), Classroom).all()
         
     return jsonify({'success': True, 'classrooms': [c.to_dict() for c in classrooms]}), 200
 
 @api_bp.route('/classrooms', methods=['POST'])
 @jwt_required()
 def create_classroom():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if user.role != 'teacher':
         return jsonify({'success': False, 'message': 'Only teachers can create classrooms'}), 403
@@ -209,11 +396,12 @@ def create_classroom():
             name=data['name'],
             code=data['code'],
             description=data.get('description', ''),
-            teacher_id=current_user_id,
+            teacher_id=user.id,
             organization_id=user.organization_id
         )
         db.session.add(new_classroom)
         db.session.commit()
+        shared_context_cache.clear()
         return jsonify({'success': True, 'classroom': new_classroom.to_dict()}), 201
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
@@ -229,13 +417,20 @@ def delete_classroom(classroom_id):
         
     try:
         # Manually delete related items if cascade is not set up in DB
+        for upload in UploadSession.query.filter_by(classroom_id=classroom_id, material_id=None):
+            storage.discard_upload(upload.id)
+        UploadSession.query.filter_by(classroom_id=classroom_id).delete()
         Material.query.filter_by(classroom_id=classroom_id).delete()
         Assignment.query.filter_by(classroom_id=classroom_id).delete()
         Enrollment.query.filter_by(classroom_id=classroom_id).delete()
         Attendance.query.filter_by(classroom_id=classroom_id).delete()
+        AttendanceSummary.query.filter_by(classroom_id=classroom_id).delete()
         
         db.session.delete(classroom)
         db.session.commit()
+        shared_context_cache.clear()
+        # Attendance for this class was deleted too
+        user_context_cache.clear()
         return jsonify({'success': True, 'message': 'Classroom deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -278,22 +473,14 @@ def upload_material(classroom_id):
     if file:
         try:
             filename = secure_filename(file.filename)
-            # Ensure uploads directory exists
-            upload_dir = os.path.join(os.getcwd(), 'uploads')
-            if not os.path.exists(upload_dir):
-                os.makedirs(upload_dir)
-                
-            file_path = os.path.join(upload_dir, filename)
-            file.save(file_path)
-            
-            # Create URL (assuming static file serving is set up for root or uploads)
-            file_url = f'/uploads/{filename}'
+            # Streamed into content-addressed storage - identical files are stored once
+            file_url, _ = storage.save_stream(file.stream, filename)
             
             new_material = Material(
                 classroom_id=classroom_id,
                 title=title,
                 file_url=file_url,
-                file_type='pdf' if filename.lower().endswith('.pdf') else 'file'
+                file_type=_material_file_type(filename)
             )
             db.session.add(new_material)
             db.session.commit()
@@ -301,6 +488,129 @@ def upload_material(classroom_id):
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)}), 500
 
+def _material_file_type(filename):
+    return 'pdf' if filename.lower().endswith('.pdf') else 'file'
+
+# --- Resumable Uploads ---
+# POST creates an upload session, then the client PUTs the raw bytes in
+# order, each chunk with ?offset= set to the bytes already received. After a
+# dropped connection, GET the session and resume from its offset. Sessions
+# left idle for UPLOAD_SESSION_MAX_AGE are expired.
+
+# Expired uploads are swept at most this often (seconds), from create_upload
+UPLOAD_SWEEP_INTERVAL = 600
+_next_upload_sweep = 0
+
+def expire_uploads():
+    """Remove unfinished uploads idle for UPLOAD_SESSION_MAX_AGE; returns how many sessions went"""
+    max_age = current_app.config['UPLOAD_SESSION_MAX_AGE']
+    storage.discard_idle_partials(max_age)
+    # Old sessions whose bytes are gone: never started, or just discarded above
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    old = db.session.query(UploadSession.id) \
+        .filter(UploadSession.created_at < cutoff, UploadSession.material_id.is_(None))
+    stale = [upload_id for upload_id, in old if not os.path.exists(storage.partial_path(upload_id))]
+    if not stale:
+        return 0
+    # A bulk DELETE, so two workers sweeping at once can't trip over each other's rows
+    return UploadSession.query.filter(UploadSession.id.in_(stale)).delete(synchronize_session=False)
+
+@api_bp.route('/classrooms/<int:classroom_id>/uploads', methods=['POST'])
+@jwt_required()
+def create_upload(classroom_id):
+    current_user_id = int(get_jwt_identity())
+    classroom = Classroom.query.get_or_404(classroom_id)
+    
+    if classroom.teacher_id != current_user_id:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    if not filename or not isinstance(size, int) or size < 0:
+        return jsonify({'success': False, 'message': 'filename and size are required'}), 400
+    max_size = current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_size is not None and size > max_size:
+        return jsonify({'success': False, 'message': f'Files can be at most {max_size // (1024 * 1024)} MB'}), 413
+    
+    global _next_upload_sweep
+    if time.monotonic() >= _next_upload_sweep:
+        _next_upload_sweep = time.monotonic() + UPLOAD_SWEEP_INTERVAL
+        expire_uploads()
+    
+    upload = UploadSession(
+        id=storage.new_session_id(),
+        user_id=current_user_id,
+        classroom_id=classroom_id,
+        filename=filename,
+        title=data.get('title') or filename,
+        size=size
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify({'success': True, 'upload': upload.to_dict(), 'chunk_size': storage.CHUNK_SIZE}), 201
+
+def _get_own_upload(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+    if upload.user_id != int(get_jwt_identity()):
+        return None
+    return upload
+
+@api_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    upload = _get_own_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    return jsonify({'success': True, 'upload': upload.to_dict()}), 200
+
+@api_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    upload = _get_own_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    if upload.material_id is not None:
+        return jsonify({'success': False, 'message': 'Upload already complete', 'upload': upload.to_dict()}), 409
+    
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'message': 'offset is required'}), 400
+    
+    try:
+        offset, digest = storage.append_chunk(upload.id, offset, request.stream, upload.size - offset)
+    except storage.OffsetMismatch as e:
+        return jsonify({'success': False, 'message': 'Offset mismatch', 'offset': e.expected}), 409
+    
+    upload.offset = offset
+    if digest is None:
+        db.session.commit()
+        return jsonify({'success': True, 'upload': upload.to_dict()}), 200
+    
+    material = Material(
+        classroom_id=upload.classroom_id,
+        title=upload.title,
+        file_url=storage.finish_upload(upload.id, digest, upload.filename),
+        file_type=_material_file_type(upload.filename)
+    )
+    db.session.add(material)
+    db.session.flush()
+    upload.material_id = material.id
+    db.session.commit()
+    return jsonify({'success': True, 'upload': upload.to_dict(), 'material': material.to_dict()}), 201
+
+@api_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_upload(upload_id):
+    upload = _get_own_upload(upload_id)
+    if upload is None:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    if upload.material_id is None:
+        storage.discard_upload(upload.id)
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'Upload cancelled'}), 200
+
 @api_bp.route('/classrooms/<int:classroom_id>/assignments', methods=['POST'])
 @jwt_required()
 def create_assignment(classroom_id):
@@ -319,6 +629,9 @@ def create_assignment(classroom_id):
             due_date=datetime.fromisoformat(data['due_date'].replace('Z', '+00:00')) if data.get('due_date') else None
         )
         db.session.add(new_assignment)
+        due = f" - due {new_assignment.due_date.strftime('%b %d, %Y')}" if new_assignment.due_date else ''
+        notify(classroom_audience(classroom_id), 'assignment', f'New assignment in {classroom.name}',
+               f'{new_assignment.title}{due}', link='/classroom.html')
         db.session.commit()
         return jsonify({'success': True, 'assignment': new_assignment.to_dict()}), 201
     except Exception as e:
@@ -0,0 +1,190 @@
+"""
+Full-text search over posts, announcements, events and messages
+
+Each searchable table gets an SQLite FTS5 external-content index
+(<table>_fts) holding only the token index - the text itself stays in the
+original table. Triggers keep the index in step with every INSERT, DELETE
+and UPDATE of the indexed columns, including bulk ORM updates that never
+load objects, so application code doesn't need to know about it.
+
+The indexes are created alongside the regular tables by db.create_all()
+and filled from existing rows the first time. To rebuild them from
+scratch (e.g. after restoring a backup):
+
+    python search.py
+
+All functions leave committing to the caller.
+"""
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from models import db
+
+# type -> (table, indexed columns, title column or None, timestamp column)
+SOURCES = {
+    'post': ('posts', ('content',), None, 'timestamp'),
+    'announcement': ('announcements', ('title', 'content'), 'title', 'created_at'),
+    'event': ('events', ('title', 'description'), 'title', 'date'),
+    'message': ('messages', ('content',), None, 'timestamp'),
+}
+
+# A title match counts this much more than a body match in bm25()
+TITLE_WEIGHT = 3.0
+SNIPPET_TOKENS = 12
+# Control characters can't appear in the indexed text, so the snippet can
+# be HTML-escaped first and the match markers turned into <mark> afterwards
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def _fts(table):
+    return f'{table}_fts'
+
+
+def _index_ddl(table, columns):
+    """CREATE statements for one external-content index and its sync triggers"""
+    fts, cols = _fts(table), ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='porter unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        # Only when an indexed column changes - marking messages read doesn't touch the index
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def is_available(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def create_search_index(connection):
+    """Create any missing index and triggers; a newly created index is filled from its table"""
+    for table, columns, _, _ in SOURCES.values():
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': _fts(table)}
+        ).first()
+        for statement in _index_ddl(table, columns):
+            connection.execute(text(statement))
+        if not exists:
+            connection.execute(text(f"INSERT INTO {_fts(table)}({_fts(table)}) VALUES ('rebuild')"))
+
+
+def drop_search_index(connection):
+    """Drop the indexes (the triggers go with their tables)"""
+    for table, _, _, _ in SOURCES.values():
+        connection.execute(text(f'DROP TABLE IF EXISTS {_fts(table)}'))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _after_create(target, connection, **kw):
+    if is_available(connection):
+        create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _before_drop(target, connection, **kw):
+    if is_available(connection):
+        drop_search_index(connection)
+
+
+def rebuild_search_index():
+    """Re-read every indexed row from the content tables; returns how many rows are indexed"""
+    connection = db.session.connection()
+    create_search_index(connection)
+    total = 0
+    for table, _, _, _ in SOURCES.values():
+        connection.execute(text(f"INSERT INTO {_fts(table)}({_fts(table)}) VALUES ('rebuild')"))
+        total += connection.execute(text(f'SELECT count(*) FROM {table}')).scalar()
+    return total
+
+
+def match_query(query):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix
+
+    Words are quoted, so operators and punctuation in user input can't
+    cause syntax errors. Returns None if there is nothing to search for.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _source_select(type, scoped):
+    table, columns, title, timestamp = SOURCES[type]
+    fts = _fts(table)
+    weights = ', '.join(str(TITLE_WEIGHT if c == title else 1.0) for c in columns)
+    where = f'{fts} MATCH :match'
+    if type == 'message':
+        # The same visibility rule as /api/messages
+        broadcast = "s.message_type = 'broadcast'"
+        if scoped:
+            broadcast += ' AND s.sender_id IN (SELECT id FROM users WHERE organization_id = :org_id)'
+        where += f' AND (s.sender_id = :user_id OR s.receiver_id = :user_id OR ({broadcast}))'
+    elif scoped:
+        where += ' AND s.organization_id = :org_id'
+    return (
+        f"SELECT '{type}' AS type, s.id AS id, bm25({fts}, {weights}) AS rank, "
+        f"{'s.' + title if title else 'NULL'} AS title, "
+        f"snippet({fts}, -1, char(2), char(3), '…', {SNIPPET_TOKENS}) AS snippet, s.{timestamp} AS timestamp "
+        f"FROM {fts} JOIN {table} AS s ON s.id = {fts}.rowid WHERE {where}"
+    )
+
+
+def search(user_id, query, types=None, limit=20, after=None, org_id=None):
+    """One page of matches for user_id, best first: (results, next cursor values or None)
+
+    Posts, announcements, events and broadcasts are limited to org_id's when it is given.
+
+    bm25() scores are compared across the per-table indexes as they are,
+    which is close enough for ranking mixed results. after is the
+    (rank, type, id) of the last result on the previous page.
+    """
+    match = match_query(query)
+    if match is None:
+        return [], None
+    types = [t for t in (types or SOURCES) if t in SOURCES]
+    if not types:
+        return [], None
+
+    params = {'match': match, 'user_id': user_id, 'org_id': org_id, 'limit': limit + 1}
+    sql = 'SELECT * FROM (' + ' UNION ALL '.join(_source_select(t, org_id is not None) for t in types) + ')'
+    if after is not None:
+        params.update(after_rank=after[0], after_type=after[1], after_id=after[2])
+        sql += (' WHERE rank > :after_rank OR (rank = :after_rank AND '
+                '(type > :after_type OR (type = :after_type AND id > :after_id)))')
+    sql += ' ORDER BY rank, type, id LIMIT :limit'
+    rows = db.session.execute(text(sql), params).all()
+
+    next_after = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_after = (last.rank, last.type, last.id)
+    results = [{
+        'type': row.type,
+        'id': row.id,
+        'title': row.title,
+        'snippet': html.escape(row.snippet or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'),
+        # Plain text SQL, so the timestamp comes back as SQLite stored it
+        'timestamp': datetime.fromisoformat(row.timestamp) if row.timestamp else None,
+    } for row in rows[:limit]]
+    return results, next_after
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print(f'Search index rebuilt ({rebuild_search_index()} rows).')
+        db.session.commit()
@@ -0,0 +1,157 @@
+"""
+Precompressed, fingerprinted static files
+
+At startup every page and asset in the project root is read once, and
+gzip (and brotli, if the brotli package is installed) variants are built
+for the compressible ones. Assets (JS, CSS, images) also get a
+content-hashed URL under /assets/, and references to them in the HTML
+pages are rewritten to that URL, so they can be cached forever
+(`Cache-Control: immutable`). Pages keep their URLs and are revalidated
+with an ETag instead.
+
+The encoding is picked per request from Accept-Encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip only without it
+    brotli = None
+
+PAGE_EXTENSIONS = {'.html'}
+ASSET_EXTENSIONS = {'.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.woff2'}
+COMPRESSIBLE_TYPES = {'application/javascript', 'text/javascript', 'application/json', 'image/svg+xml'}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+def negotiate_encoding(available, accept_encodings=None):
+    """Return the best of 'br' / 'gzip' in available the client accepts, or None for identity"""
+    accept = accept_encodings if accept_encodings is not None else request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accept.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding, level=None):
+    """Compress body with 'gzip' or 'br'"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if level is None else level)
+    return gzip.compress(body, compresslevel=9 if level is None else level, mtime=0)
+
+
+def is_compressible(mimetype):
+    """Whether a response of this type is worth compressing"""
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+class StaticFile:
+    """One file held in memory with its encoded variants"""
+
+    def __init__(self, name, body, mimetype, cache_control):
+        self.name = name
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {None: body}
+        if is_compressible(mimetype):
+            for encoding in ('gzip', 'br') if brotli else ('gzip',):
+                encoded = compress(body, encoding)
+                # Not worth it if it barely shrinks
+                if len(encoded) < len(body) * 0.9:
+                    self.variants[encoding] = encoded
+
+
+class StaticAssets:
+    """Builds and serves the in-memory static files"""
+
+    def __init__(self):
+        self.root = None
+        self.pages = {}  # 'index.html' -> StaticFile
+        self.assets = {}  # 'chatbot_widget.js' -> StaticFile
+        self.hashed = {}  # 'chatbot_widget.1a2b3c4d.js' -> StaticFile
+        self._mtimes = {}
+
+    def init_app(self, app):
+        """Build from app.root_path; with app.debug, files are rebuilt when they change"""
+        self.root = app.root_path
+        self.build()
+
+        @app.before_request
+        def _reload_changed_static_files():
+            if current_app.debug and self._changed():
+                self.build()
+
+    def _files(self):
+        for name in sorted(os.listdir(self.root)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in PAGE_EXTENSIONS | ASSET_EXTENSIONS and os.path.isfile(os.path.join(self.root, name)):
+                yield name, ext
+
+    def _changed(self):
+        return {name: os.path.getmtime(os.path.join(self.root, name)) for name, _ in self._files()} != self._mtimes
+
+    def build(self):
+        """(Re)read every file, fingerprint assets and rewrite page references"""
+        pages, assets, hashed, mtimes = {}, {}, {}, {}
+        page_sources = {}
+        for name, ext in self._files():
+            path = os.path.join(self.root, name)
+            mtimes[name] = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                body = f.read()
+            if ext in PAGE_EXTENSIONS:
+                page_sources[name] = body
+                continue
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            asset = StaticFile(name, body, mimetype, IMMUTABLE)
+            stem, _ = os.path.splitext(name)
+            asset.url = f'/assets/{stem}.{asset.etag[:8]}{ext}'
+            assets[name] = asset
+            hashed[asset.url.rsplit('/', 1)[1]] = asset
+
+        # src="chatbot_widget.js" / src="/IOMP_LOGO.png" -> src="/assets/..."
+        if assets:
+            reference = re.compile(r'''((?:src|href)=["'])/?(%s)(["'])''' % '|'.join(map(re.escape, assets)))
+            for name, body in page_sources.items():
+                html = reference.sub(lambda m: m.group(1) + assets[m.group(2)].url + m.group(3), body.decode('utf-8'))
+                pages[name] = StaticFile(name, html.encode('utf-8'), 'text/html', REVALIDATE)
+        else:
+            pages = {name: StaticFile(name, body, 'text/html', REVALIDATE) for name, body in page_sources.items()}
+
+        self.pages, self.assets, self.hashed, self._mtimes = pages, assets, hashed, mtimes
+
+    def url_for(self, name):
+        """Fingerprinted URL of an asset, e.g. url_for('IOMP_LOGO.png')"""
+        return self.assets[name].url
+
+    def get(self, path):
+        """The StaticFile for a page or asset by its plain file name, or None"""
+        return self.pages.get(path) or self.assets.get(path)
+
+    def send(self, static_file, cache_control=None):
+        """Response for a StaticFile, encoded for this client and conditional on its ETag"""
+        encoding = negotiate_encoding(static_file.variants)
+        response = current_app.response_class(static_file.variants[encoding], mimetype=static_file.mimetype)
+        response.set_etag(static_file.etag + ('-' + encoding if encoding else ''))
+        response.headers['Cache-Control'] = cache_control or static_file.cache_control
+        if len(static_file.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response.make_conditional(request)
+
+    def send_page(self, name):
+        """Serve one of the HTML pages"""
+        return self.send(self.pages[name])
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,234 @@
+"""
+Content-addressed storage for uploaded materials
+
+Uploads are streamed to disk in fixed-size blocks and hashed (SHA-256) as
+they arrive, then moved to uploads/cas/<aa>/<sha256><ext>. Identical files
+are stored once however many classrooms they are uploaded to - the same
+syllabus posted to 30 sections is one file on disk.
+
+Resumable uploads write to uploads/partial/<session id> until all bytes
+have arrived. The running hash for each partial file is kept in a bounded
+in-memory cache; if it is lost (evicted, or after a restart) it is rebuilt
+from the bytes on disk. Partial files nobody has written to for a while are
+removed by discard_idle_partials.
+
+Downloads go through send_upload, which supports Range / If-Range and
+conditional GETs, and can hand the transfer to the front-end web server
+(UPLOADS_OFFLOAD = 'x-sendfile' or 'x-accel') so app workers aren't tied up.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import threading
+import time
+import uuid
+
+from flask import current_app, request, abort
+from werkzeug.security import safe_join
+from werkzeug.utils import send_from_directory
+
+from cache import TTLCache
+
+CHUNK_SIZE = 1024 * 1024  # Read/write block size for streamed uploads
+
+# session id -> (offset, sha256 object); a miss just means rehashing the file
+_partial_hashes = TTLCache(maxsize=256, ttl=3600)
+_writing = set()  # session ids with a chunk being written right now
+_writing_guard = threading.Lock()
+
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the upload left off"""
+
+    def __init__(self, expected):
+        super().__init__(f'Expected offset {expected}')
+        self.expected = expected
+
+
+def upload_root():
+    """Directory all uploads live under"""
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def _cas_relpath(digest, ext):
+    return f'cas/{digest[:2]}/{digest}{ext}'
+
+
+def file_extension(filename):
+    """Lower-cased extension kept on stored files so they are served with the right type"""
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext.isascii() and len(ext) <= 10 and ext[1:].isalnum() else ''
+
+
+def copy_stream(stream, out, hasher, limit=None):
+    """Copy stream into out in CHUNK_SIZE blocks, hashing as it goes; return bytes copied"""
+    copied = 0
+    while limit is None or copied < limit:
+        block = stream.read(CHUNK_SIZE if limit is None else min(CHUNK_SIZE, limit - copied))
+        if not block:
+            break
+        hasher.update(block)
+        out.write(block)
+        copied += len(block)
+    return copied
+
+
+def store_file(tmp_path, digest, ext):
+    """Move a fully written temp file into CAS; return its URL
+
+    If the content is already stored the temp file is simply dropped.
+    """
+    relpath = _cas_relpath(digest, ext)
+    final_path = os.path.join(upload_root(), relpath)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+    return f'/uploads/{relpath}'
+
+
+def save_stream(stream, filename):
+    """Stream a whole upload (e.g. a werkzeug FileStorage stream) into CAS; return (url, size)"""
+    partial_dir = os.path.join(upload_root(), 'partial')
+    os.makedirs(partial_dir, exist_ok=True)
+    tmp_path = os.path.join(partial_dir, uuid.uuid4().hex)
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as out:
+            size = copy_stream(stream, out, hasher)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return store_file(tmp_path, hasher.hexdigest(), file_extension(filename)), size
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def partial_path(session_id):
+    return os.path.join(upload_root(), 'partial', session_id)
+
+
+def _hash_so_far(session_id, offset):
+    """Running hash for the first offset bytes of a partial upload"""
+    cached = _partial_hashes.get(session_id)
+    if cached is not None and cached[0] == offset:
+        return cached[1].copy()
+    hasher = hashlib.sha256()
+    with open(partial_path(session_id), 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(block)
+    return hasher
+
+
+def _start_writing(session_id):
+    """Claim a partial upload for one writer; False if another request is writing it"""
+    with _writing_guard:
+        if session_id in _writing:
+            return False
+        _writing.add(session_id)
+        return True
+
+
+def _stop_writing(session_id):
+    with _writing_guard:
+        _writing.discard(session_id)
+
+
+def append_chunk(session_id, offset, stream, remaining):
+    """Append up to remaining bytes from stream to a partial upload at offset
+
+    Raises OffsetMismatch unless offset is where the bytes on disk end (or
+    while another request is writing the same upload).
+    Returns (new offset, sha256 hex digest once every byte is in, else None).
+    """
+    path = partial_path(session_id)
+    if not _start_writing(session_id):
+        raise OffsetMismatch(os.path.getsize(path) if os.path.exists(path) else 0)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        on_disk = os.path.getsize(path) if os.path.exists(path) else 0
+        if offset != on_disk:
+            raise OffsetMismatch(on_disk)
+        hasher = _hash_so_far(session_id, offset) if offset else hashlib.sha256()
+        with open(path, 'ab') as out:
+            written = copy_stream(stream, out, hasher, limit=remaining)
+        offset += written
+        if written == remaining:
+            _partial_hashes.invalidate(session_id)
+            return offset, hasher.hexdigest()
+        _partial_hashes.set(session_id, (offset, hasher.copy()))
+        return offset, None
+    finally:
+        _stop_writing(session_id)
+
+
+def finish_upload(session_id, digest, filename):
+    """Move a completed partial upload into CAS; return its URL"""
+    return store_file(partial_path(session_id), digest, file_extension(filename))
+
+
+def discard_upload(session_id):
+    """Forget a partial upload and delete its bytes"""
+    _partial_hashes.invalidate(session_id)
+    if os.path.exists(partial_path(session_id)):
+        os.remove(partial_path(session_id))
+
+
+def discard_idle_partials(max_age):
+    """Delete partial files nobody has written to for max_age seconds; returns their names"""
+    partial_dir = os.path.join(upload_root(), 'partial')
+    if not os.path.isdir(partial_dir):
+        return []
+    cutoff = time.time() - max_age
+    idle = [entry.name for entry in os.scandir(partial_dir)
+            if entry.is_file() and entry.stat().st_mtime < cutoff and entry.name not in _writing]
+    for name in idle:
+        discard_upload(name)
+    return idle
+
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def send_upload(filename):
+    """Response for GET /uploads/<filename>
+
+    CAS files never change, so they are cached as immutable. Without an
+    offload mode, werkzeug answers Range/If-Range with 206 and
+    If-None-Match/If-Modified-Since with 304, and streams the file through
+    wsgi.file_wrapper (sendfile under servers that support it).
+    """
+    # Check prefixes on the normalized name: safe_join still resolves cas/../partial/<id>
+    filename = posixpath.normpath(filename)
+    if filename == 'partial' or filename.startswith('partial/'):
+        abort(404)
+    path = safe_join(upload_root(), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    immutable = filename.startswith('cas/')
+    offload = current_app.config.get('UPLOADS_OFFLOAD')
+
+    if offload == 'x-accel':
+        # nginx serves the bytes (and handles Range) from an internal location
+        prefix = current_app.config.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads')
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{filename}"
+    else:
+        # With x-sendfile the body is replaced by an X-Sendfile header for Apache/lighttpd
+        response = send_from_directory(
+            upload_root(), filename, request.environ,
+            conditional=True,
+            use_x_sendfile=offload == 'x-sendfile',
+            response_class=current_app.response_class,
+            max_age=31536000 if immutable else current_app.get_send_file_max_age(filename)
+        )
+
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+    return response
@@ -0,0 +1,133 @@
+"""
+Per-organization scoping and database routing
+
+Every authenticated request belongs to an organization: the `org` claim
+in its JWT, or the user's organization_id for tokens issued before the
+claim existed. activate() records it on flask.g for the rest of the
+request.
+
+Scoping: list endpoints pass their queries through scoped(), so a user
+in an organization only sees that organization's rows. With the
+(organization_id, ...) indexes, the work per request grows with one
+tenant's data, not with the whole install. Users without an organization,
+and anonymous requests, keep seeing everything, as before.
+
+Routing: an organization listed in TENANT_DATABASES keeps all of its data
+in its own database. TenantSession.get_bind sends every statement of
+that organization's requests there. Only GLOBAL_TABLES stay on the main
+database. The main users table remains the login directory: email ->
+organization. export_tenant.py copies an organization into its own
+database.
+
+    TENANT_DATABASES='{"5": "sqlite:///tenants/org_5.db"}'
+
+This module must not import models - models imports TenantSession.
+"""
+import threading
+
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_sqlalchemy.session import Session
+from jwt.exceptions import PyJWTError
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import NoInspectionAvailable
+
+# Tables that always live on the main database
+GLOBAL_TABLES = {'organizations'}
+
+_engines = {}  # database URL -> Engine, shared by every request
+_engines_lock = threading.Lock()
+
+
+def tenant_url(org_id):
+    """Database URL of an organization with its own database, else None"""
+    if org_id is None:
+        return None
+    return current_app.config.get('TENANT_DATABASES', {}).get(str(org_id))
+
+
+def tenant_engine(org_id):
+    """Engine for an organization's own database (created with the schema on first use), else None"""
+    url = tenant_url(org_id)
+    if url is None:
+        return None
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            from models import db
+            engine = _engines[url] = create_engine(url)
+            db.metadata.create_all(engine)
+        return engine
+
+
+def activate(org_id):
+    """Scope (and, if it has its own database, route) the rest of this request to org_id"""
+    engine = tenant_engine(org_id)
+    if engine is not g.get('tenant_engine'):
+        # Objects loaded so far came from the other database; ids can repeat across databases
+        from models import db
+        db.session.expunge_all()
+    g.org_id = org_id
+    g.tenant_engine = engine
+
+
+def activate_optional():
+    """For public endpoints: scope to the caller's organization if a valid token came with the request"""
+    try:
+        verify_jwt_in_request(optional=True)  # The user loader calls activate()
+    except (JWTExtendedException, PyJWTError):
+        pass  # Expired or bad tokens get the anonymous view, as before
+
+
+def current_org_id():
+    """The organization of the current request, or None (no scoping)"""
+    return g.get('org_id') if has_app_context() else None
+
+
+def current_bind_key():
+    """Identifies the database the current request uses: the tenant's URL, or None for the main one"""
+    engine = g.get('tenant_engine') if has_app_context() else None
+    return str(engine.url) if engine is not None else None
+
+
+def cache_key(key):
+    """Namespace an in-process cache key by database, so equal ids from two databases can't collide"""
+    bind = current_bind_key()
+    return key if bind is None else (bind, key)
+
+
+def scoped(query, model, org_id=None):
+    """Filter query to org_id's rows of model (default: the current request's organization)"""
+    org_id = current_org_id() if org_id is None else org_id
+    if org_id is None:
+        return query
+    return query.filter(model.organization_id == org_id)
+
+
+def init_tenancy(app):
+    """Start every request unscoped, on the main database, until activate() is called"""
+    @app.before_request
+    def _reset_tenant():
+        activate(None)
+
+
+def _table_name(mapper, clause):
+    if mapper is not None:
+        try:
+            return inspect(mapper).local_table.name
+        except NoInspectionAvailable:
+            return None
+    table = getattr(clause, 'table', None)
+    return getattr(table, 'name', None)
+
+
+class TenantSession(Session):
+    """db.session class: statements of a routed organization's requests go to its database"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            engine = g.get('tenant_engine')
+            if engine is not None and _table_name(mapper, clause) not in GLOBAL_TABLES:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,134 @@
+"""
+Test attendance recording and the maintained per-student summary
+"""
+from datetime import date
+
+from attendance import attendance_totals, rebuild_attendance_summaries
+from models import db, Attendance, AttendanceSummary, Classroom
+
+
+def _classroom(teacher, code='CS101'):
+    classroom = Classroom(name='Class', code=code, teacher_id=teacher.id)
+    db.session.add(classroom)
+    db.session.commit()
+    return classroom
+
+
+def _mark(client, headers, classroom, student, day, status):
+    return client.post('/api/attendance/mark', headers=headers, json={
+        'classroom_id': classroom.id, 'student_id': student.id, 'date': day, 'status': status})
+
+
+def test_mark_attendance_updates_summary(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    maths, physics = _classroom(teacher, 'MTH'), _classroom(teacher, 'PHY')
+    headers = auth_headers(teacher)
+
+    _mark(client, headers, maths, student, '2025-01-13', 'present')
+    _mark(client, headers, maths, student, '2025-01-14', 'absent')
+    _mark(client, headers, physics, student, '2025-01-14', 'present')
+
+    summary = db.session.get(AttendanceSummary, (student.id, maths.id))
+    assert (summary.present, summary.absent, summary.total) == (1, 1, 2)
+    assert attendance_totals(student.id) == (3, 2)
+
+
+def test_totals_for_student_without_history(app, make_user):
+    assert attendance_totals(make_user().id) == (0, 0)
+
+
+def test_rebuild_matches_incremental_summary(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    classroom = _classroom(teacher)
+    headers = auth_headers(teacher)
+    for day, status in [('2025-01-13', 'present'), ('2025-01-14', 'late'), ('2025-01-15', 'present')]:
+        _mark(client, headers, classroom, student, day, status)
+    # Rows written before summaries existed
+    db.session.add(Attendance(classroom_id=classroom.id, user_id=student.id, date=date(2025, 1, 10), status='excused'))
+    db.session.commit()
+
+    rebuild_attendance_summaries()
+
+    summary = db.session.get(AttendanceSummary, (student.id, classroom.id))
+    assert (summary.present, summary.late, summary.excused, summary.total) == (2, 1, 1, 4)
+
+
+def test_delete_classroom_removes_summaries(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    classroom = _classroom(teacher)
+    headers = auth_headers(teacher)
+    _mark(client, headers, classroom, student, '2025-01-13', 'present')
+
+    client.delete(f'/api/classrooms/{classroom.id}', headers=headers)
+
+    assert attendance_totals(student.id) == (0, 0)
+
+
+def test_marking_same_day_again_corrects_the_row(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    classroom = _classroom(teacher)
+    headers = auth_headers(teacher)
+
+    _mark(client, headers, classroom, student, '2025-01-13', 'absent')
+    _mark(client, headers, classroom, student, '2025-01-13', 'present')
+
+    assert Attendance.query.filter_by(user_id=student.id).count() == 1
+    assert attendance_totals(student.id) == (1, 1)
+
+
+def test_bulk_marks_whole_class_and_is_idempotent(client, make_user, auth_headers):
+    teacher = make_user(role='teacher')
+    students = [make_user() for _ in range(3)]
+    classroom = _classroom(teacher)
+    headers = auth_headers(teacher)
+    roster = [{'student_id': s.id, 'status': 'present'} for s in students]
+
+    first = client.post('/api/attendance/bulk', headers=headers, json={
+        'classroom_id': classroom.id, 'date': '2025-01-13', 'records': roster})
+    roster[0]['status'] = 'absent'
+    second = client.post('/api/attendance/bulk', headers=headers, json={
+        'classroom_id': classroom.id, 'date': '2025-01-13', 'records': roster})
+
+    assert first.get_json()['created'] == 3
+    assert (second.get_json()['updated'], second.get_json()['unchanged']) == (1, 2)
+    assert Attendance.query.count() == 3
+    assert attendance_totals(students[0].id) == (1, 0)
+    assert attendance_totals(students[1].id) == (1, 1)
+
+
+def test_bulk_rejects_unknown_status(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    classroom = _classroom(teacher)
+
+    response = client.post('/api/attendance/bulk', headers=auth_headers(teacher), json={
+        'classroom_id': classroom.id, 'date': '2025-01-13',
+        'records': [{'student_id': student.id, 'status': 'asleep'}]})
+
+    assert response.status_code == 400
+    assert Attendance.query.count() == 0
+
+    for status in ({}, []):
+        response = client.post('/api/attendance/bulk', headers=auth_headers(teacher), json={
+            'classroom_id': classroom.id, 'date': '2025-01-13',
+            'records': [{'student_id': student.id, 'status': status}]})
+        assert response.status_code == 400
+
+
+def test_mark_rejects_unknown_status(client, make_user, auth_headers):
+    teacher, student = make_user(role='teacher'), make_user()
+    classroom = _classroom(teacher)
+
+    assert _mark(client, auth_headers(teacher), classroom, student, '2025-01-13', 'asleep').status_code == 400
+    assert _mark(client, auth_headers(teacher), classroom, student, '2025-01-13', {}).status_code == 400
+    assert Attendance.query.count() == 0
+    assert AttendanceSummary.query.count() == 0
+
+
+def test_bulk_requires_teacher(client, make_user, auth_headers):
+    student = make_user()
+    classroom = _classroom(make_user(role='teacher'))
+
+    response = client.post('/api/attendance/bulk', headers=auth_headers(student), json={
+        'classroom_id': classroom.id, 'date': '2025-01-13', 'records': []})
+
+    assert response.status_code == 403
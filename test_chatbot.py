@@ -0,0 +1,102 @@
+"""
+Test the chatbot context cache and streaming endpoint
+"""
+import json
+
+import chatbot
+from cache import llm_response_cache
+from chatbot import get_user_context
+from fake_groq import FakeGroq
+from models import db, Classroom, ChatMessage
+from query_audit import capture_statements
+
+
+def _selects(fn):
+    with capture_statements() as statements:
+        result = fn()
+    return result, sum(1 for sql, _ in statements if sql.lstrip().upper().startswith('SELECT'))
+
+
+def test_repeated_context_hits_database_once(app, make_user):
+    student, teacher = make_user(), make_user(role='teacher', name='Dr. Smith')
+    db.session.add(Classroom(name='Physics', code='PHY1', teacher_id=teacher.id))
+    db.session.commit()
+
+    first, first_queries = _selects(lambda: get_user_context(student.id))
+    again, again_queries = _selects(lambda: get_user_context(student.id))
+
+    assert first_queries > 0
+    assert again_queries == 0
+    assert again == first
+    assert first['classrooms'] == [{'id': 1, 'name': 'Physics', 'teacher': 'Dr. Smith'}]
+
+
+def test_shared_context_is_reused_across_users(app, make_user):
+    alice, bob = make_user(), make_user()
+    get_user_context(alice.id)
+
+    with capture_statements() as statements:
+        get_user_context(bob.id)
+
+    # Only the per-user pieces are loaded for the second user
+    assert statements
+    assert not any('FROM announcements' in sql or 'FROM classrooms' in sql for sql, _ in statements)
+
+
+def test_mark_attendance_invalidates_student_context(client, make_user, auth_headers):
+    student, teacher = make_user(), make_user(role='teacher')
+    classroom = Classroom(name='Maths', code='MTH1', teacher_id=teacher.id)
+    db.session.add(classroom)
+    db.session.commit()
+    assert get_user_context(student.id)['attendance']['total'] == 0
+
+    client.post('/api/attendance/mark', headers=auth_headers(teacher), json={
+        'classroom_id': classroom.id, 'student_id': student.id, 'date': '2025-01-15', 'status': 'present'})
+
+    assert get_user_context(student.id)['attendance'] == {'total': 1, 'present': 1, 'percentage': 100.0}
+
+
+def test_create_announcement_invalidates_shared_context(client, make_user, auth_headers):
+    student, teacher = make_user(), make_user(role='teacher')
+    assert get_user_context(student.id)['recent_announcements'] == []
+
+    client.post('/api/announcements', headers=auth_headers(teacher), json={'title': 'Exam', 'content': 'Monday'})
+
+    assert [a['title'] for a in get_user_context(student.id)['recent_announcements']] == ['Exam']
+
+
+def _sse_events(response):
+    events = []
+    for frame in response.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in frame.splitlines() if ': ' in line)
+        if 'data' in lines:
+            events.append((lines.get('event'), json.loads(lines['data'])))
+    return events
+
+
+def test_chat_stream_sends_tokens_then_saves_reply(client, make_user, auth_headers, monkeypatch):
+    monkeypatch.setattr(chatbot, 'client', FakeGroq(latency=0))
+    llm_response_cache.clear()
+    student = make_user()
+
+    response = client.post('/api/chat/stream', headers=auth_headers(student), json={'message': 'Explain recursion'})
+    events = _sse_events(response)
+
+    assert response.mimetype == 'text/event-stream'
+    tokens = [data['token'] for event, data in events if event == 'token']
+    assert len(tokens) > 1
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['reply'] == ''.join(tokens).strip()
+    saved = ChatMessage.query.filter_by(user_id=student.id).one()
+    assert saved.response == events[-1][1]['reply']
+
+
+def test_chat_stream_answers_data_queries_without_llm(client, make_user, auth_headers, monkeypatch):
+    fake = FakeGroq(latency=0)
+    monkeypatch.setattr(chatbot, 'client', fake)
+    student = make_user()
+
+    response = client.post('/api/chat/stream', headers=auth_headers(student), json={'message': 'my attendance?'})
+
+    assert 'Your Attendance' in _sse_events(response)[-1][1]['reply']
+    assert fake.calls == 0
@@ -0,0 +1,46 @@
+"""
+Tests for negotiated response compression
+"""
+import gzip
+import json
+
+from models import db, Post
+
+
+def test_large_json_is_gzipped(client, make_user, auth_headers):
+    me = make_user('admin')
+    for _ in range(40):
+        make_user()
+
+    plain = client.get('/api/users', headers=auth_headers(me))
+    assert 'Content-Encoding' not in plain.headers
+
+    response = client.get('/api/users', headers={**auth_headers(me), 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    assert len(response.data) * 5 < len(plain.data)
+
+
+def test_small_responses_are_not_compressed(client, make_user, auth_headers):
+    response = client.get('/api/user', headers={**auth_headers(make_user()), 'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_compressed_feed_still_revalidates(client, make_user):
+    author = make_user()
+    db.session.add_all([Post(author_id=author.id, content='x' * 200) for _ in range(20)])
+    db.session.commit()
+
+    first = client.get('/api/posts', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert first.headers['ETag'].startswith('W/')
+
+    again = client.get('/api/posts', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_streamed_responses_are_left_alone(client, make_user, auth_headers):
+    response = client.post('/api/chat/stream', json={'message': 'hi ' * 500},
+                           headers={**auth_headers(make_user()), 'Accept-Encoding': 'gzip'})
+    assert response.is_streamed and 'Content-Encoding' not in response.headers
@@ -0,0 +1,106 @@
+"""
+Tests for per-conversation read state
+"""
+from conversations import rebuild_conversations
+from models import db, Conversation, Message
+
+
+def _send(client, headers, receiver_id, content='hi'):
+    response = client.post('/api/messages', headers=headers, json={'receiver_id': receiver_id, 'content': content})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _state():
+    return {(c.user_id, c.peer_id): (c.last_message_id, c.unread_count)
+            for c in Conversation.query.order_by(Conversation.user_id, Conversation.peer_id)}
+
+
+def test_sending_updates_both_sides(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    first = _send(client, auth_headers(alice), bob.id)
+    second = _send(client, auth_headers(alice), bob.id)
+
+    assert _state() == {(alice.id, bob.id): (second, 0), (bob.id, alice.id): (second, 2)}
+    reply = _send(client, auth_headers(bob), alice.id)
+    assert _state() == {(alice.id, bob.id): (reply, 1), (bob.id, alice.id): (reply, 2)}
+    assert first < second < reply
+
+
+def test_mark_read_up_to_an_id(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    ids = [_send(client, auth_headers(alice), bob.id, f'm{i}') for i in range(3)]
+    headers = auth_headers(bob)
+
+    response = client.post('/api/messages/read', headers=headers, json={'peer_id': alice.id, 'up_to_id': ids[1]})
+    assert response.get_json() == {'peer_id': alice.id, 'unread_count': 1}
+    assert [m.is_read for m in Message.query.order_by(Message.id)] == [True, True, False]
+
+    # Marking again doesn't double-count
+    client.post('/api/messages/read', headers=headers, json={'peer_id': alice.id, 'up_to_id': ids[1]})
+    assert client.get('/api/messages/unread', headers=headers).get_json() == {'total': 1, 'by_peer': {str(alice.id): 1}}
+
+    response = client.post('/api/messages/read', headers=headers, json={'peer_id': alice.id})
+    assert response.get_json()['unread_count'] == 0
+    assert client.get('/api/messages/unread', headers=headers).get_json() == {'total': 0, 'by_peer': {}}
+
+
+def test_mark_read_validates_ids(client, make_user, auth_headers):
+    headers = auth_headers(make_user())
+    assert client.post('/api/messages/read', headers=headers, json={'peer_id': '2'}).status_code == 400
+    assert client.post('/api/messages/read', headers=headers, json={}).status_code == 400
+
+
+def test_unread_totals_across_peers(client, make_user, auth_headers):
+    me, alice, bob = make_user(), make_user(), make_user()
+    _send(client, auth_headers(alice), me.id)
+    _send(client, auth_headers(bob), me.id)
+    _send(client, auth_headers(bob), me.id)
+    _send(client, auth_headers(me), me.id)  # Notes to self are never unread
+
+    data = client.get('/api/messages/unread', headers=auth_headers(me)).get_json()
+    assert data == {'total': 3, 'by_peer': {str(alice.id): 1, str(bob.id): 2}}
+
+
+def test_rebuild_matches_maintained_rows(client, make_user, auth_headers):
+    alice, bob, carol = make_user(), make_user(), make_user()
+    _send(client, auth_headers(alice), bob.id)
+    _send(client, auth_headers(bob), alice.id)
+    _send(client, auth_headers(carol), alice.id)
+    _send(client, auth_headers(alice), alice.id)
+    client.post('/api/messages/read', headers=auth_headers(alice), json={'peer_id': bob.id})
+    maintained = _state()
+
+    assert rebuild_conversations() == len(maintained)
+    db.session.commit()
+    assert _state() == maintained
+
+
+def test_conversation_list_is_sorted_and_paged(client, make_user, auth_headers):
+    me, alice, bob, carol = make_user(), make_user(), make_user(), make_user()
+    _send(client, auth_headers(alice), me.id, 'from alice')
+    _send(client, auth_headers(me), bob.id, 'to bob')
+    last = _send(client, auth_headers(carol), me.id, 'x' * 500)
+    headers = auth_headers(me)
+
+    first = client.get('/api/messages/conversations?limit=2', headers=headers).get_json()
+    assert [c['peer_id'] for c in first['conversations']] == [carol.id, bob.id]
+    latest = first['conversations'][0]
+    assert latest['peer_name'] == carol.name and latest['unread_count'] == 1
+    assert latest['last_message']['id'] == last and len(latest['last_message']['preview']) == 120
+    assert first['conversations'][1]['last_message']['sender_id'] == me.id
+
+    rest = client.get(f"/api/messages/conversations?limit=2&before_id={first['next_before_id']}",
+                      headers=headers).get_json()
+    assert [c['peer_id'] for c in rest['conversations']] == [alice.id]
+    assert rest['next_before_id'] is None
+
+
+def test_messages_for_one_peer(client, make_user, auth_headers):
+    me, alice, bob = make_user(), make_user(), make_user()
+    _send(client, auth_headers(alice), me.id, 'a1')
+    _send(client, auth_headers(bob), me.id, 'b1')
+    _send(client, auth_headers(me), alice.id, 'a2')
+
+    thread = client.get(f'/api/messages?peer_id={alice.id}&since_id=0', headers=auth_headers(me)).get_json()
+    assert [m['content'] for m in thread] == ['a1', 'a2']
@@ -0,0 +1,43 @@
+"""
+Test the events API
+"""
+from datetime import datetime
+
+from models import db, Event
+
+
+def _add_events(organizer, *dates):
+    for i, date in enumerate(dates):
+        db.session.add(Event(title=f'event {i}', date=date, organizer_id=organizer.id))
+    db.session.commit()
+
+
+def test_events_filtered_by_range(client, make_user):
+    _add_events(make_user(role='teacher'),
+                datetime(2025, 1, 31, 23, 0), datetime(2025, 2, 1, 0, 0),
+                datetime(2025, 2, 28, 12, 0), datetime(2025, 3, 1, 0, 0))
+
+    response = client.get('/api/events?from=2025-02-01T00:00:00Z&to=2025-03-01T00:00:00Z')
+
+    assert [e['date'] for e in response.get_json()['events']] == ['2025-02-28T12:00:00', '2025-02-01T00:00:00']
+
+
+def test_events_without_range_returns_everything(client, make_user):
+    _add_events(make_user(role='teacher'), datetime(2024, 5, 1), datetime(2025, 5, 1))
+
+    assert len(client.get('/api/events').get_json()['events']) == 2
+
+
+def test_month_summary_counts_events_per_day(client, make_user):
+    _add_events(make_user(role='teacher'),
+                datetime(2025, 2, 3, 9, 0), datetime(2025, 2, 3, 15, 0),
+                datetime(2025, 2, 10, 9, 0), datetime(2025, 3, 3, 9, 0))
+
+    response = client.get('/api/events/summary?month=2025-02')
+
+    assert response.get_json()['days'] == {'2025-02-03': 2, '2025-02-10': 1}
+
+
+def test_invalid_range_is_rejected(client):
+    assert client.get('/api/events?from=yesterday').status_code == 400
+    assert client.get('/api/events/summary').status_code == 400
@@ -0,0 +1,42 @@
+"""
+Tests for the batched, parallel user import
+"""
+from import_users import import_users_from_csv
+from models import db, User
+
+HEADER = 'user_id,uid,org_id,email,password,role,department_id,first_name,last_name,status,created_at\n'
+
+
+def _write_csv(path, rows):
+    path.write_text(HEADER + ''.join(
+        f'{i},u{i},1,{email},{password},{role},1,{first},{last},active,2025-01-01\n'
+        for i, (email, password, role, first, last) in enumerate(rows, 1)
+    ))
+
+
+def test_import_creates_then_updates_users_by_email(app, tmp_path):
+    rounds, app.config['BCRYPT_LOG_ROUNDS'] = app.config['BCRYPT_LOG_ROUNDS'], 4
+    try:
+        csv_path = tmp_path / 'users.csv'
+        _write_csv(csv_path, [
+            ('Ada@Iomp.test', 'pw-ada', 'Admin', 'Ada', 'Lovelace'),
+            ('bob@iomp.test', 'pw-bob', 'Student', 'Bob', 'Stone'),
+            ('cy@iomp.test', 'pw-cy', 'Staff', 'Cy', 'Young'),
+        ])
+        assert import_users_from_csv(str(csv_path), batch_size=2, workers=1, show_credentials=False) == (3, 0)
+
+        ada = User.query.filter_by(email='ada@iomp.test').one()
+        ada_id = ada.id
+        assert ada.name == 'Ada Lovelace' and ada.role == 'admin'
+        assert ada.check_password('pw-ada')
+
+        _write_csv(csv_path, [('ada@iomp.test', 'new-pw', 'Admin', 'Ada', 'King')])
+        assert import_users_from_csv(str(csv_path), workers=1, show_credentials=False) == (0, 1)
+
+        db.session.expire_all()
+        ada = User.query.filter_by(email='ada@iomp.test').one()
+        assert ada.id == ada_id and ada.name == 'Ada King'
+        assert ada.check_password('new-pw')
+        assert User.query.count() == 3
+    finally:
+        app.config['BCRYPT_LOG_ROUNDS'] = rounds
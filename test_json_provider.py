@@ -0,0 +1,40 @@
+"""
+Tests for the JSON provider and the row-based list serialization
+"""
+from datetime import datetime
+
+import pytest
+
+from json_provider import OrjsonProvider, StdlibJSONProvider, orjson
+from models import db, Message, User
+
+PROVIDERS = [StdlibJSONProvider] + ([OrjsonProvider] if orjson else [])
+
+
+@pytest.mark.parametrize('provider_class', PROVIDERS)
+def test_providers_encode_datetimes_like_isoformat(app, provider_class):
+    provider = provider_class(app)
+    stamps = [datetime(2025, 1, 2, 3, 4, 5), datetime(2025, 1, 2, 3, 4, 5, 678901)]
+    assert provider.loads(provider.dumps({'at': stamps})) == {'at': [s.isoformat() for s in stamps]}
+
+
+def test_users_rows_match_to_dict(client, make_user, auth_headers):
+    me = make_user('teacher')
+    make_user('student')
+
+    response = client.get('/api/users', headers=auth_headers(me))
+    expected = [u.to_dict() for u in User.query.order_by(db.func.lower(User.name), User.id)]
+    assert response.get_json()['users'] == expected
+
+
+def test_message_rows_match_to_dict(client, make_user, auth_headers):
+    me, peer = make_user(), make_user()
+    db.session.add_all([
+        Message(sender_id=peer.id, receiver_id=me.id, content='hi'),
+        Message(sender_id=me.id, content='all', message_type='broadcast'),
+    ])
+    db.session.commit()
+    expected = [m.to_dict() for m in Message.list_query().order_by(Message.id)]
+
+    assert client.get('/api/messages', headers=auth_headers(me)).get_json() == expected
+    assert client.get('/api/messages?since_id=0', headers=auth_headers(me)).get_json() == expected
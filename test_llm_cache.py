@@ -0,0 +1,95 @@
+"""
+Test LLM response caching and request coalescing with the offline fake client
+"""
+import threading
+import time
+
+import pytest
+
+import chatbot
+from cache import TTLCache, llm_response_cache
+from fake_groq import FakeGroq
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    llm_response_cache.clear()
+    fake = FakeGroq(latency=0.2)
+    monkeypatch.setattr(chatbot, 'client', fake)
+    return fake
+
+
+def _ask_concurrently(prompts):
+    replies = [None] * len(prompts)
+
+    def ask(i, prompt):
+        replies[i] = chatbot.complete_chat('system', prompt)
+
+    threads = [threading.Thread(target=ask, args=(i, p)) for i, p in enumerate(prompts)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return replies
+
+
+def test_identical_concurrent_prompts_share_one_call(fake_client):
+    started = time.monotonic()
+    replies = _ask_concurrently(['When is the exam?'] * 20)
+
+    assert fake_client.calls == 1
+    assert len(set(replies)) == 1
+    # Everyone waited on the same call rather than queueing behind each other
+    assert time.monotonic() - started < 1
+
+
+def test_normalized_prompts_hit_the_cache(fake_client):
+    first = chatbot.complete_chat('system', 'When is the exam?')
+    again = chatbot.complete_chat('system', '  when IS the   exam? ')
+
+    assert again == first
+    assert fake_client.calls == 1
+
+
+def test_different_context_is_not_shared(fake_client):
+    chatbot.complete_chat('system for alice', 'What is my attendance?')
+    chatbot.complete_chat('system for bob', 'What is my attendance?')
+
+    assert fake_client.calls == 2
+
+
+def test_hit_rate_for_a_burst_of_repeated_questions(fake_client):
+    fake_client.latency = 0
+    hits_before = llm_response_cache.stats['hits']
+    questions = ['exam date?', 'library hours?', 'exam date?', 'fee deadline?'] * 25
+    for q in questions:
+        chatbot.complete_chat('system', q)
+
+    assert fake_client.calls == 3
+    assert llm_response_cache.stats['hits'] - hits_before == len(questions) - 3
+
+
+def test_failed_call_is_not_cached():
+    cache = TTLCache()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('upstream down')
+        return 'ok'
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('k', flaky)
+    assert cache.get_or_compute('k', flaky) == 'ok'
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
@@ -0,0 +1,83 @@
+"""
+Tests for login hashing on the bounded bcrypt pool
+"""
+import threading
+
+import pytest
+
+from models import db, bcrypt
+from password_pool import login_pool, hash_cost
+
+
+@pytest.fixture
+def fast_bcrypt(app):
+    """Use a cheap cost factor, restoring the real one afterwards"""
+    def set_rounds(rounds):
+        app.config['BCRYPT_LOG_ROUNDS'] = rounds
+        bcrypt.init_app(app)
+
+    original = app.config['BCRYPT_LOG_ROUNDS']
+    set_rounds(4)
+    yield set_rounds
+    set_rounds(original)
+
+
+def _login(client, email, password):
+    return client.post('/api/auth/login', json={'email': email, 'password': password})
+
+
+def test_login_verifies_on_pool(client, make_user, fast_bcrypt):
+    user = make_user('student')
+    user.set_password('secret-pw')
+    db.session.commit()
+    completed = login_pool.stats['completed']
+
+    assert _login(client, user.email, 'secret-pw').status_code == 200
+    assert _login(client, user.email, 'wrong-pw').status_code == 401
+    assert login_pool.stats['completed'] == completed + 2
+
+
+def test_login_rehashes_when_cost_changes(client, make_user, fast_bcrypt):
+    user = make_user('student')
+    user.set_password('secret-pw')
+    db.session.commit()
+    assert hash_cost(user.password_hash) == 4
+
+    fast_bcrypt(5)
+    assert _login(client, user.email, 'secret-pw').status_code == 200
+
+    db.session.refresh(user)
+    assert hash_cost(user.password_hash) == 5
+    assert user.check_password('secret-pw')
+
+
+def test_login_returns_503_when_pool_is_full(client, make_user, fast_bcrypt):
+    user = make_user('student')
+    user.set_password('secret-pw')
+    db.session.commit()
+
+    release = threading.Event()
+    login_pool.configure(workers=1, max_pending=1)
+    blocker = threading.Thread(target=login_pool.run, args=(release.wait,))
+    blocker.start()
+    try:
+        while login_pool.pending < 1:
+            pass
+        response = _login(client, user.email, 'secret-pw')
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+    finally:
+        release.set()
+        blocker.join()
+        login_pool.init_app(client.application)
+
+    assert _login(client, user.email, 'secret-pw').status_code == 200
+
+
+def test_login_metrics_are_admin_only(client, make_user, auth_headers):
+    assert client.get('/api/auth/login-metrics', headers=auth_headers(make_user('student'))).status_code == 403
+
+    response = client.get('/api/auth/login-metrics', headers=auth_headers(make_user('admin')))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert 'total_ms' in body['metrics'] and body['bcrypt_rounds'] == 12
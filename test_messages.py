@@ -0,0 +1,124 @@
+"""
+Test the messaging API
+"""
+import json
+
+from message_hub import MessageHub
+from models import db, Message
+
+
+def _send(sender, receiver, content):
+    msg = Message(sender_id=sender.id, receiver_id=receiver.id if receiver else None,
+                  content=content, message_type='direct' if receiver else 'broadcast')
+    db.session.add(msg)
+    db.session.commit()
+    return msg
+
+
+def test_full_history_without_cursor(client, make_user, auth_headers):
+    alice, bob, carol = make_user(), make_user(), make_user()
+    _send(alice, bob, 'hi bob')
+    _send(carol, None, 'hello everyone')
+    _send(bob, carol, 'private')
+
+    response = client.get('/api/messages', headers=auth_headers(alice))
+
+    assert response.status_code == 200
+    assert [m['content'] for m in response.get_json()] == ['hi bob', 'hello everyone']
+
+
+def test_since_id_returns_only_newer_messages(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(5)]
+
+    response = client.get(f'/api/messages?since_id={sent[2].id}', headers=auth_headers(bob))
+
+    assert [m['id'] for m in response.get_json()] == [sent[3].id, sent[4].id]
+
+
+def test_since_id_pages_forward_with_limit(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(5)]
+
+    response = client.get('/api/messages?since_id=0&limit=2', headers=auth_headers(bob))
+
+    assert [m['id'] for m in response.get_json()] == [sent[0].id, sent[1].id]
+
+
+def test_before_id_returns_previous_page_oldest_first(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(5)]
+
+    response = client.get(f'/api/messages?before_id={sent[4].id}&limit=2', headers=auth_headers(alice))
+
+    assert [m['id'] for m in response.get_json()] == [sent[2].id, sent[3].id]
+
+
+def test_limit_alone_returns_latest_page(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(5)]
+
+    response = client.get('/api/messages?limit=3', headers=auth_headers(alice))
+
+    assert [m['id'] for m in response.get_json()] == [m.id for m in sent[2:]]
+
+
+def _read_events(response, count):
+    """Read SSE data events off a streaming response"""
+    events = []
+    for chunk in response.response:
+        text = chunk.decode() if isinstance(chunk, bytes) else chunk
+        for line in text.splitlines():
+            if line.startswith('data: '):
+                events.append(json.loads(line[len('data: '):]))
+        if len(events) >= count:
+            break
+    return events
+
+
+def test_stream_catches_up_from_last_event_id(client, make_user, auth_headers):
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(3)]
+    headers = dict(auth_headers(bob), **{'Last-Event-ID': str(sent[0].id)})
+
+    response = client.get('/api/messages/stream', headers=headers, buffered=False)
+
+    assert response.mimetype == 'text/event-stream'
+    assert [m['id'] for m in _read_events(response, 2)] == [sent[1].id, sent[2].id]
+
+
+def test_stream_pushes_new_visible_messages_only(app, client, make_user, auth_headers, monkeypatch):
+    monkeypatch.setitem(app.config, 'MESSAGE_STREAM_KEEPALIVE', 0.05)
+    alice, bob, carol = make_user(), make_user(), make_user()
+    token = auth_headers(bob)['Authorization'].split()[1]
+
+    response = client.get(f'/api/messages/stream?jwt={token}', buffered=False)
+    client.post('/api/messages', headers=auth_headers(alice), json={'receiver_id': carol.id, 'content': 'not for bob'})
+    client.post('/api/messages', headers=auth_headers(alice), json={'receiver_id': 'all', 'content': 'everyone'})
+    client.post('/api/messages', headers=auth_headers(alice), json={'receiver_id': bob.id, 'content': 'hi bob'})
+
+    assert [m['content'] for m in _read_events(response, 2)] == ['everyone', 'hi bob']
+
+
+def test_stream_catch_up_is_drained_in_batches(client, make_user, auth_headers, monkeypatch):
+    monkeypatch.setattr('app.CATCH_UP_BATCH', 2)
+    alice, bob = make_user(), make_user()
+    sent = [_send(alice, bob, f'message {i}') for i in range(6)]
+    headers = dict(auth_headers(bob), **{'Last-Event-ID': str(sent[0].id)})
+
+    response = client.get('/api/messages/stream', headers=headers, buffered=False)
+
+    assert [m['id'] for m in _read_events(response, 5)] == [m.id for m in sent[1:]]
+
+
+def test_stream_catch_up_starts_from_connection_time(app, client, make_user, auth_headers, monkeypatch):
+    monkeypatch.setitem(app.config, 'MESSAGE_STREAM_KEEPALIVE', 0.05)
+    monkeypatch.setattr('app.message_hub', MessageHub(history=1))
+    alice, bob = make_user(), make_user()
+    _send(alice, bob, 'old news')
+
+    response = client.get('/api/messages/stream', headers=auth_headers(bob), buffered=False)
+    for i in range(3):  # More than the hub holds, so the stream has to catch up from the database
+        client.post('/api/messages', headers=auth_headers(alice), json={'receiver_id': bob.id, 'content': f'new {i}'})
+
+    assert [m['content'] for m in _read_events(response, 3)] == ['new 0', 'new 1', 'new 2']
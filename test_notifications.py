@@ -0,0 +1,117 @@
+"""
+Tests for database-backed notifications and unread counters
+"""
+from models import db, Classroom, Enrollment, NotificationCounter, Organization
+from query_audit import capture_statements
+
+
+def _notifications(client, headers, query=''):
+    return client.get(f'/api/auth/notifications{query}', headers=headers).get_json()
+
+
+def test_announcement_notifies_the_organization(client, make_user, auth_headers):
+    org, other_org = Organization(name='A', domain='a.test'), Organization(name='B', domain='b.test')
+    db.session.add_all([org, other_org])
+    db.session.commit()
+    admin = make_user('admin', organization_id=org.id)
+    colleague = make_user('student', organization_id=org.id)
+    outsider = make_user('student', organization_id=other_org.id)
+
+    response = client.post('/api/announcements', headers=auth_headers(admin),
+                           json={'title': 'Library hours', 'content': 'Open late during exams'})
+    assert response.status_code == 201
+
+    data = _notifications(client, auth_headers(colleague))
+    assert data['unread_count'] == 1
+    assert data['notifications'][0]['title'] == 'Library hours'
+    assert data['notifications'][0]['icon'] == 'fa-bullhorn'
+    assert _notifications(client, auth_headers(outsider))['unread_count'] == 0
+    assert _notifications(client, auth_headers(admin))['unread_count'] == 0
+
+
+def test_count_only_is_a_single_lookup(client, make_user, auth_headers):
+    sender, me = make_user(), make_user()
+    client.post('/api/messages', headers=auth_headers(sender), json={'receiver_id': me.id, 'content': 'hi'})
+    headers = auth_headers(me)
+    client.get('/api/user', headers=headers)  # Warm the user cache
+
+    with capture_statements() as statements:
+        data = _notifications(client, headers, '?count_only=1')
+    assert data == {'success': True, 'unread_count': 1}
+    assert len(statements) == 1 and 'notification_counters' in statements[0][0]
+
+
+def test_since_id_returns_only_new_notifications(client, make_user, auth_headers):
+    teacher, student = make_user('teacher'), make_user('student')
+    classroom = Classroom(name='Algebra', code='ALG1', teacher_id=teacher.id)
+    db.session.add(classroom)
+    db.session.flush()
+    db.session.add(Enrollment(user_id=student.id, classroom_id=classroom.id))
+    db.session.commit()
+    headers = auth_headers(student)
+
+    client.post(f'/api/classrooms/{classroom.id}/assignments', headers=auth_headers(teacher), json={'title': 'HW 1'})
+    first = _notifications(client, headers)
+    assert [n['message'] for n in first['notifications']] == ['HW 1']
+
+    assert _notifications(client, headers, f"?since_id={first['latest_id']}")['notifications'] == []
+    client.post(f'/api/classrooms/{classroom.id}/assignments', headers=auth_headers(teacher), json={'title': 'HW 2'})
+    new = _notifications(client, headers, f"?since_id={first['latest_id']}")
+    assert [n['message'] for n in new['notifications']] == ['HW 2']
+    assert new['unread_count'] == 2
+
+
+def test_since_id_pages_through_a_burst(client, make_user, auth_headers):
+    admin, student = make_user('admin'), make_user('student')
+    headers = auth_headers(student)
+    latest_id = _notifications(client, headers)['latest_id'] or 0
+    for i in range(5):
+        client.post('/api/announcements', headers=auth_headers(admin), json={'title': f'Notice {i}', 'content': '...'})
+
+    seen, has_more = [], True
+    while has_more:
+        page = _notifications(client, headers, f'?since_id={latest_id}&limit=2')
+        seen += [n['title'] for n in reversed(page['notifications'])]
+        latest_id, has_more = page['latest_id'], page['has_more']
+
+    assert seen == [f'Notice {i}' for i in range(5)]
+
+
+def test_marking_read_keeps_counter_in_step(client, make_user, auth_headers):
+    sender, me = make_user(), make_user()
+    for text in ('one', 'two', 'three'):
+        client.post('/api/messages', headers=auth_headers(sender), json={'receiver_id': me.id, 'content': text})
+    headers = auth_headers(me)
+    ids = [n['id'] for n in _notifications(client, headers)['notifications']]
+
+    response = client.put(f'/api/auth/notifications/{ids[0]}/read', headers=headers)
+    assert response.get_json()['unread_count'] == 2
+    # Reading it again doesn't decrement twice
+    assert client.put(f'/api/auth/notifications/{ids[0]}/read', headers=headers).get_json()['unread_count'] == 2
+    assert client.put(f'/api/auth/notifications/{ids[0]}/read', headers=auth_headers(sender)).status_code == 404
+
+    assert client.put('/api/auth/notifications/read-all', headers=headers).status_code == 200
+    assert _notifications(client, headers, '?unread=1')['notifications'] == []
+    assert db.session.get(NotificationCounter, me.id).unread == 0
+
+
+def test_broadcast_notifies_everyone_but_the_sender(client, make_user, auth_headers):
+    admin = make_user('admin')
+    others = [make_user() for _ in range(3)]
+    client.post('/api/messages', headers=auth_headers(admin), json={'receiver_id': 'all', 'content': 'Campus closed'})
+
+    assert all(_notifications(client, auth_headers(u), '?count_only=1')['unread_count'] == 1 for u in others)
+    assert _notifications(client, auth_headers(admin), '?count_only=1')['unread_count'] == 0
+
+
+def test_creator_without_organization_does_not_notify_organizations(client, make_user, auth_headers):
+    org = Organization(name='A', domain='a.test')
+    db.session.add(org)
+    db.session.commit()
+    admin, loner, member = make_user('admin'), make_user(), make_user(organization_id=org.id)
+
+    client.post('/api/announcements', headers=auth_headers(admin), json={'title': 'Hello', 'content': '...'})
+    client.post('/api/messages', headers=auth_headers(admin), json={'receiver_id': 'all', 'content': 'Hi all'})
+
+    assert _notifications(client, auth_headers(loner), '?count_only=1')['unread_count'] == 2
+    assert _notifications(client, auth_headers(member), '?count_only=1')['unread_count'] == 0
@@ -0,0 +1,57 @@
+"""
+Test the home feed
+"""
+from datetime import datetime, timedelta
+
+from models import db, Post
+
+
+def _add_posts(author, count):
+    start = datetime(2025, 1, 1)
+    for i in range(count):
+        db.session.add(Post(author_id=author.id, content=f'post {i}', timestamp=start + timedelta(minutes=i)))
+    db.session.commit()
+
+
+def test_feed_pages_with_cursor(client, make_user):
+    _add_posts(make_user(), 5)
+
+    first = client.get('/api/posts?limit=2').get_json()
+    second = client.get(f"/api/posts?limit=2&before={first['next_cursor']}").get_json()
+    third = client.get(f"/api/posts?limit=2&before={second['next_cursor']}").get_json()
+
+    contents = [p['content'] for page in (first, second, third) for p in page['posts']]
+    assert contents == ['post 4', 'post 3', 'post 2', 'post 1', 'post 0']
+    assert third['next_cursor'] is None
+
+
+def test_page_size_is_capped(client, make_user):
+    _add_posts(make_user(), 60)
+
+    assert len(client.get('/api/posts?limit=1000').get_json()['posts']) == 50
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get('/api/posts?before=not-a-cursor').status_code == 400
+
+
+def test_unchanged_feed_is_not_modified(client, make_user):
+    _add_posts(make_user(), 3)
+
+    first = client.get('/api/posts')
+    again = client.get('/api/posts', headers={'If-None-Match': first.headers['ETag']})
+
+    assert again.status_code == 304
+    assert again.data == b''
+
+
+def test_create_post_invalidates_cached_feed(client, make_user, auth_headers):
+    author = make_user()
+    _add_posts(author, 3)
+    etag = client.get('/api/posts').headers['ETag']
+
+    client.post('/api/posts', headers=auth_headers(author), json={'content': 'fresh'})
+    response = client.get('/api/posts', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.get_json()['posts'][0]['content'] == 'fresh'
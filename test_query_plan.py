@@ -0,0 +1,10 @@
+"""
+Fail the build when an audited endpoint starts scanning a whole table
+"""
+from query_audit import run_audit
+
+
+def test_no_unexpected_table_scans(app):
+    findings = run_audit(app)
+
+    assert findings == [], '\n'.join(f"{f['request']}: {f.get('table', f.get('error'))}" for f in findings)
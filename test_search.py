@@ -0,0 +1,95 @@
+"""
+Tests for FTS5 full-text search
+"""
+from datetime import datetime
+
+from models import db, Announcement, Event, Message, Post
+from search import match_query, rebuild_search_index
+
+
+def _search(client, headers, query):
+    response = client.get(f'/api/search?{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_searches_every_source_with_snippets(client, make_user, auth_headers):
+    me = make_user('teacher')
+    db.session.add_all([
+        Post(author_id=me.id, content='Photos from the robotics workshop'),
+        Announcement(author_id=me.id, title='Robotics club', content='Meets on Fridays'),
+        Event(organizer_id=me.id, title='Hackathon', description='Build robots overnight', date=datetime(2030, 1, 1)),
+        Message(sender_id=me.id, content='Bring the robot kits', message_type='broadcast'),
+        Post(author_id=me.id, content='Unrelated'),
+    ])
+    db.session.commit()
+
+    data = _search(client, auth_headers(me), 'q=robot')
+    assert sorted(r['type'] for r in data['results']) == ['announcement', 'event', 'message', 'post']
+    # Title matches are weighted up
+    assert data['results'][0]['type'] == 'announcement'
+    assert data['results'][0]['title'] == 'Robotics club'
+    post = next(r for r in data['results'] if r['type'] == 'post')
+    assert '<mark>robotics</mark>' in post['snippet']
+
+    only_posts = _search(client, auth_headers(me), 'q=robot&type=post,event')
+    assert sorted(r['type'] for r in only_posts['results']) == ['event', 'post']
+
+
+def test_messages_respect_visibility(client, make_user, auth_headers):
+    alice, bob, eve = make_user(), make_user(), make_user()
+    client.post('/api/messages', headers=auth_headers(alice), json={'receiver_id': bob.id, 'content': 'secret plans'})
+
+    assert len(_search(client, auth_headers(bob), 'q=secret')['results']) == 1
+    assert len(_search(client, auth_headers(alice), 'q=secret')['results']) == 1
+    assert _search(client, auth_headers(eve), 'q=secret')['results'] == []
+
+
+def test_index_follows_updates_and_deletes(client, make_user, auth_headers):
+    me = make_user()
+    post = Post(author_id=me.id, content='original wording')
+    db.session.add(post)
+    db.session.commit()
+    headers = auth_headers(me)
+
+    post.content = 'revised wording'
+    db.session.commit()
+    assert _search(client, headers, 'q=original')['results'] == []
+    assert len(_search(client, headers, 'q=revised')['results']) == 1
+
+    db.session.delete(post)
+    db.session.commit()
+    assert _search(client, headers, 'q=wording')['results'] == []
+
+
+def test_pagination(client, make_user, auth_headers):
+    me = make_user()
+    db.session.add_all([Post(author_id=me.id, content=f'exam notes part {i}') for i in range(5)])
+    db.session.commit()
+    headers = auth_headers(me)
+
+    seen, cursor = [], ''
+    while True:
+        data = _search(client, headers, f'q=exam&limit=2{cursor}')
+        seen += [r['id'] for r in data['results']]
+        if not data['next_cursor']:
+            break
+        cursor = f"&after={data['next_cursor']}"
+    assert sorted(seen) == sorted(p.id for p in Post.query)
+
+
+def test_user_input_is_not_fts_syntax(client, make_user, auth_headers):
+    headers = auth_headers(make_user())
+    assert match_query('"unbalanced AND (') == '"unbalanced" "AND"*'
+    assert _search(client, headers, 'q=%22unbalanced%20AND%20(')['results'] == []
+    assert client.get('/api/search?q=', headers=headers).status_code == 400
+
+
+def test_rebuild(client, make_user, auth_headers):
+    me = make_user()
+    db.session.add(Post(author_id=me.id, content='rebuild me'))
+    db.session.commit()
+
+    assert rebuild_search_index() == 1
+    db.session.commit()
+    assert len(_search(client, auth_headers(me), 'q=rebuild')['results']) == 1
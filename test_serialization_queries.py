@@ -0,0 +1,79 @@
+"""
+List endpoints must run a fixed number of queries, however many rows they return
+"""
+from cache import feed_cache, user_cache
+from models import db, Message, Post, Classroom
+from query_audit import capture_statements
+
+
+def _count_selects(client, url, headers=None):
+    # Start from a cold authenticated-user cache so every request is measured alike
+    user_cache.clear()
+    with capture_statements() as statements:
+        response = client.get(url, headers=headers or {})
+    assert response.status_code == 200
+    return sum(1 for sql, _ in statements if sql.lstrip().upper().startswith('SELECT'))
+
+
+def test_messages_query_count_is_constant(client, make_user, auth_headers):
+    me = make_user()
+    headers = auth_headers(me)
+
+    def add_messages(n):
+        for _ in range(n):
+            peer = make_user()
+            db.session.add(Message(sender_id=peer.id, receiver_id=me.id, content='hi'))
+            db.session.add(Message(sender_id=peer.id, content='all', message_type='broadcast'))
+        db.session.commit()
+
+    add_messages(2)
+    small = _count_selects(client, '/api/messages', headers)
+    add_messages(20)
+    large = _count_selects(client, '/api/messages', headers)
+
+    assert small == large
+    assert _count_selects(client, '/api/messages?since_id=0', headers) == small
+
+
+def test_posts_query_count_is_constant(client, make_user):
+    def add_posts(n):
+        for _ in range(n):
+            db.session.add(Post(author_id=make_user().id, content='post'))
+        db.session.commit()
+
+    # Bypass the first-page cache so both requests really hit the database
+    add_posts(2)
+    feed_cache.clear()
+    small = _count_selects(client, '/api/posts')
+    add_posts(20)
+    feed_cache.clear()
+
+    assert _count_selects(client, '/api/posts') == small
+
+
+def test_classrooms_query_count_is_constant(client, make_user, auth_headers):
+    student = make_user()
+    headers = auth_headers(student)
+
+    def add_classrooms(n):
+        for _ in range(n):
+            teacher = make_user(role='teacher')
+            db.session.add(Classroom(name='Class', code=f'C{teacher.id}', teacher_id=teacher.id))
+        db.session.commit()
+
+    add_classrooms(2)
+    small = _count_selects(client, '/api/classrooms', headers)
+    add_classrooms(20)
+
+    assert _count_selects(client, '/api/classrooms', headers) == small
+
+
+def test_list_serialization_keeps_names(client, make_user, auth_headers):
+    alice, bob = make_user(name='Alice'), make_user(name='Bob')
+    db.session.add(Message(sender_id=alice.id, receiver_id=bob.id, content='hi'))
+    db.session.add(Message(sender_id=alice.id, content='all', message_type='broadcast'))
+    db.session.commit()
+
+    messages = client.get('/api/messages', headers=auth_headers(bob)).get_json()
+
+    assert [(m['sender_name'], m['receiver_name']) for m in messages] == [('Alice', 'Bob'), ('Alice', 'All Users')]
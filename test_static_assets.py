@@ -0,0 +1,49 @@
+"""
+Tests for precompressed, fingerprinted static files
+"""
+import gzip
+import os
+import re
+
+from static_assets import static_assets
+
+
+def test_pages_reference_fingerprinted_assets(client):
+    response = client.get('/')
+    html = response.get_data(as_text=True)
+
+    logo = static_assets.url_for('IOMP_LOGO.png')
+    assert re.fullmatch(r'/assets/IOMP_LOGO\.[0-9a-f]{8}\.png', logo)
+    assert f'src="{logo}"' in html
+    assert static_assets.url_for('chatbot_widget.js') in html
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_fingerprinted_asset_is_immutable_and_gzipped(client):
+    url = static_assets.url_for('chatbot_widget.js')
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    with open(os.path.join(static_assets.root, 'chatbot_widget.js'), 'rb') as f:
+        assert gzip.decompress(response.data) == f.read()
+
+
+def test_identity_when_client_does_not_accept_gzip(client):
+    response = client.get('/messages', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert b'<html' in response.data.lower()
+
+
+def test_etag_revalidation_returns_304(client):
+    first = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_images_are_not_recompressed_and_unknown_hashes_404(client):
+    response = client.get(static_assets.url_for('IOMP_LOGO.png'), headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert client.get('/assets/IOMP_LOGO.deadbeef.png').status_code == 404
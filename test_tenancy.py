@@ -0,0 +1,223 @@
+"""
+Tests for per-organization scoping, database routing and tenant export
+"""
+import re
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token, decode_token
+from sqlalchemy import create_engine, text
+
+from export_tenant import export_tenant
+from message_hub import MessageHub
+from models import db, bcrypt, Announcement, Classroom, Enrollment, Event, Organization, Post
+
+
+@pytest.fixture
+def orgs(app):
+    a, b = Organization(name='A', domain='a.test'), Organization(name='B', domain='b.test')
+    db.session.add_all([a, b])
+    db.session.commit()
+    return a, b
+
+
+@pytest.fixture
+def fast_bcrypt(app):
+    original = app.config['BCRYPT_LOG_ROUNDS']
+    app.config['BCRYPT_LOG_ROUNDS'] = 4
+    bcrypt.init_app(app)
+    yield
+    app.config['BCRYPT_LOG_ROUNDS'] = original
+    bcrypt.init_app(app)
+
+
+@pytest.fixture
+def tenant_databases(app):
+    """Set TENANT_DATABASES for one test"""
+    original = app.config['TENANT_DATABASES']
+    yield lambda databases: app.config.__setitem__('TENANT_DATABASES', databases)
+    app.config['TENANT_DATABASES'] = original
+
+
+def _seed(user, org):
+    db.session.add_all([
+        Event(title=f'{org.name} fair', organizer_id=user.id, organization_id=org.id, date=datetime(2030, 1, 1)),
+        Announcement(title=f'{org.name} notice', content='...', author_id=user.id, organization_id=org.id),
+        Post(author_id=user.id, organization_id=org.id, content=f'{org.name} post'),
+        Classroom(name=f'{org.name} class', code=f'{org.name}101', teacher_id=user.id, organization_id=org.id),
+    ])
+    db.session.commit()
+
+
+def _titles(client, headers):
+    return {
+        'events': [e['title'] for e in client.get('/api/events', headers=headers).get_json()['events']],
+        'announcements': [a['title'] for a in client.get('/api/announcements', headers=headers).get_json()['announcements']],
+        'posts': [p['content'] for p in client.get('/api/posts', headers=headers).get_json()['posts']],
+        'classrooms': [c['name'] for c in client.get('/api/classrooms', headers=headers).get_json()['classrooms']],
+        'users': [u['name'] for u in client.get('/api/users', headers=headers).get_json()['users']],
+    }
+
+
+def test_login_token_carries_the_organization(client, make_user, orgs, fast_bcrypt):
+    user = make_user(organization_id=orgs[0].id)
+    user.set_password('secret-pw')
+    db.session.commit()
+
+    response = client.post('/api/auth/login', json={'email': user.email, 'password': 'secret-pw'})
+    assert decode_token(response.get_json()['token'])['org'] == orgs[0].id
+
+
+def test_lists_are_scoped_to_the_organization(client, make_user, auth_headers, orgs):
+    a, b = orgs
+    teacher_a = make_user('teacher', name='Teacher A', organization_id=a.id)
+    teacher_b = make_user('teacher', name='Teacher B', organization_id=b.id)
+    _seed(teacher_a, a)
+    _seed(teacher_b, b)
+
+    student_a = make_user('student', name='Student A', organization_id=a.id)
+    assert _titles(client, auth_headers(student_a)) == {
+        'events': ['A fair'], 'announcements': ['A notice'], 'posts': ['A post'],
+        'classrooms': ['A class'], 'users': ['Student A', 'Teacher A'],
+    }
+
+    # No organization (and anonymous requests) see everything, as before
+    unaffiliated = make_user('student', name='Loner')
+    assert sorted(_titles(client, auth_headers(unaffiliated))['events']) == ['A fair', 'B fair']
+    assert sorted(p['content'] for p in client.get('/api/posts').get_json()['posts']) == ['A post', 'B post']
+
+
+def test_search_is_scoped_to_the_organization(client, make_user, auth_headers, orgs):
+    a, b = orgs
+    _seed(make_user('teacher', organization_id=a.id), a)
+    _seed(make_user('teacher', organization_id=b.id), b)
+
+    data = client.get('/api/search?q=fair', headers=auth_headers(make_user(organization_id=b.id))).get_json()
+    assert [r['title'] for r in data['results']] == ['B fair']
+
+
+def test_export_copies_only_the_organization(app, make_user, orgs, tmp_path):
+    a, b = orgs
+    teacher_a, teacher_b = make_user('teacher', organization_id=a.id), make_user('teacher', organization_id=b.id)
+    _seed(teacher_a, a)
+    _seed(teacher_b, b)
+    student = make_user(organization_id=a.id)
+    db.session.add(Enrollment(user_id=student.id, classroom_id=Classroom.query.filter_by(organization_id=a.id).one().id))
+    db.session.commit()
+
+    url = f'sqlite:///{tmp_path}/a.db'
+    counts = export_tenant(a.id, url)
+    assert counts['organizations'] == 1 and counts['users'] == 2 and counts['enrollments'] == 1
+    with create_engine(url).connect() as tenant:
+        assert tenant.execute(text('SELECT title FROM events')).scalars().all() == ['A fair']
+        assert tenant.execute(text("SELECT rowid FROM posts_fts WHERE posts_fts MATCH 'post'")).all()
+
+    with pytest.raises(ValueError):
+        export_tenant(a.id, url)
+
+
+def test_routed_organization_uses_its_own_database(client, make_user, orgs, tenant_databases, tmp_path):
+    a, _ = orgs
+    member = make_user('teacher', organization_id=a.id)
+    url = f'sqlite:///{tmp_path}/a.db'
+    export_tenant(a.id, url)
+    tenant_databases({str(a.id): url})
+    headers = {'Authorization': f"Bearer {create_access_token(identity=str(member.id), additional_claims={'org': a.id})}"}
+
+    response = client.post('/api/posts', headers=headers, json={'content': 'only in the tenant database'})
+    assert response.status_code == 201
+
+    with create_engine(url).connect() as tenant:
+        assert tenant.execute(text('SELECT content FROM posts')).scalars().all() == ['only in the tenant database']
+    with db.engine.connect() as main:
+        assert main.execute(text('SELECT count(*) FROM posts')).scalar() == 0
+
+    assert [p['content'] for p in client.get('/api/posts', headers=headers).get_json()['posts']] == \
+        ['only in the tenant database']
+    assert client.get('/api/posts').get_json()['posts'] == []
+
+
+def test_login_reads_a_routed_user_from_its_database(client, make_user, orgs, tenant_databases, tmp_path, fast_bcrypt):
+    a, _ = orgs
+    member = make_user(organization_id=a.id)
+    member.set_password('secret-pw')
+    db.session.commit()
+    url = f'sqlite:///{tmp_path}/a.db'
+    export_tenant(a.id, url)
+    tenant_databases({str(a.id): url})
+
+    # The main row is only the login directory now
+    with db.engine.begin() as main:
+        main.execute(text("UPDATE users SET password_hash = 'stale'"))
+
+    response = client.post('/api/auth/login', json={'email': member.email, 'password': 'secret-pw'})
+    assert response.status_code == 200
+
+
+def test_event_detail_reads_a_routed_organization_from_its_database(client, make_user, orgs, tenant_databases,
+                                                                     tmp_path):
+    a, b = orgs
+    member = make_user('teacher', organization_id=a.id)
+    url = f'sqlite:///{tmp_path}/a.db'
+    export_tenant(a.id, url)
+    tenant_databases({str(a.id): url})
+    _seed(make_user('teacher', organization_id=b.id), b)
+    headers = {'Authorization': f"Bearer {create_access_token(identity=str(member.id), additional_claims={'org': a.id})}"}
+
+    response = client.post('/api/events', headers=headers, json={'title': 'A fair', 'date': '2030-01-01T00:00:00'})
+    event_id = response.get_json()['event']['id']
+    # Same id as B's event in the main database
+    assert client.get(f'/api/events/{event_id}').get_json()['event']['title'] == 'B fair'
+
+    assert client.get(f'/api/events/{event_id}', headers=headers).get_json()['event']['title'] == 'A fair'
+
+
+def test_broadcasts_stay_in_the_organization(client, make_user, auth_headers, orgs):
+    a, b = orgs
+    admin_a = make_user('admin', organization_id=a.id)
+    student_a, student_b = make_user(organization_id=a.id), make_user(organization_id=b.id)
+    client.post('/api/messages', headers=auth_headers(admin_a), json={'receiver_id': 'all', 'content': 'A fire drill'})
+
+    for student, expected in ((student_a, ['A fire drill']), (student_b, [])):
+        headers = auth_headers(student)
+        assert [m['content'] for m in client.get('/api/messages', headers=headers).get_json()] == expected
+        assert len(client.get('/api/auth/notifications', headers=headers).get_json()['notifications']) == len(expected)
+        assert len(client.get('/api/search?q=drill&type=message', headers=headers).get_json()['results']) == len(expected)
+
+
+def test_hub_only_hands_out_the_organizations_broadcasts():
+    hub = MessageHub()
+    hub.publish({'id': 1, 'message_type': 'broadcast'}, organization_id=1)
+    hub.publish({'id': 2, 'message_type': 'broadcast'}, organization_id=2)
+    hub.publish({'id': 3, 'message_type': 'direct'}, organization_id=2)
+
+    assert [m['id'] for m in hub.wait(0, 0, organization_id=1)[1]] == [1, 3]
+    assert [m['id'] for m in hub.wait(0, 0)[1]] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('page, url', [
+    ('/', 'url'),  # loadPosts: /api/posts with an optional ?before=
+    ('/events', "'/api/events'"),
+    ('/event_register.html', '`/api/events/${eventId}`'),
+])
+def test_pages_send_the_token_to_scoped_endpoints(client, page, url):
+    """Without it activate_optional() sees an anonymous request and nothing is scoped"""
+    html = client.get(page).get_data(as_text=True)
+    calls = [args.split(',', 1) for args in re.findall(r'fetch\(([^)]*)\)', html)]
+    options = [rest[0] for first, *rest in calls if first.strip() == url]
+    assert options and all('headers' in o for o in options)
+
+
+def test_routed_event_list_needs_the_token(client, make_user, orgs, tenant_databases, tmp_path):
+    a, b = orgs
+    member = make_user('teacher', organization_id=a.id)
+    export_tenant(a.id, f'sqlite:///{tmp_path}/a.db')
+    tenant_databases({str(a.id): f'sqlite:///{tmp_path}/a.db'})
+    _seed(make_user('teacher', organization_id=b.id), b)
+    headers = {'Authorization': f"Bearer {create_access_token(identity=str(member.id), additional_claims={'org': a.id})}"}
+    client.post('/api/events', headers=headers, json={'title': 'A fair', 'date': '2030-01-01T00:00:00'})
+
+    # What the events page got before it sent the token: the main database's events
+    assert [e['title'] for e in client.get('/api/events').get_json()['events']] == ['B fair']
+    assert [e['title'] for e in client.get('/api/events', headers=headers).get_json()['events']] == ['A fair']
+    assert 'Authorization' in client.get('/api/posts', headers=headers).headers['Vary']
@@ -0,0 +1,198 @@
+"""
+Tests for streamed, resumable, content-addressed material uploads
+"""
+import hashlib
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import storage
+from models import db, Classroom, Material, UploadSession
+from routes_new import expire_uploads
+
+
+@pytest.fixture
+def upload_dir(app, tmp_path):
+    original = app.config['UPLOAD_FOLDER']
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    yield tmp_path
+    app.config['UPLOAD_FOLDER'] = original
+
+
+@pytest.fixture
+def teacher_classrooms(make_user):
+    teacher = make_user('teacher')
+    classrooms = [Classroom(name=f'Section {i}', code=f'SEC{i}', teacher_id=teacher.id) for i in range(3)]
+    db.session.add_all(classrooms)
+    db.session.commit()
+    return teacher, classrooms
+
+
+def _stored_files(upload_dir):
+    return [f for _, _, files in os.walk(upload_dir / 'cas') for f in files]
+
+
+def test_same_file_in_many_classrooms_is_stored_once(client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    for classroom in classrooms:
+        response = client.post(f'/api/classrooms/{classroom.id}/materials', headers=auth_headers(teacher),
+                               data={'title': 'Syllabus', 'file': (io.BytesIO(b'%PDF syllabus'), 'syllabus.pdf')})
+        assert response.status_code == 201
+
+    urls = {m.file_url for m in Material.query.all()}
+    assert len(urls) == 1 and urls.pop().endswith('.pdf')
+    assert len(_stored_files(upload_dir)) == 1
+
+
+def test_resumable_upload_in_chunks(client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    headers = auth_headers(teacher)
+    body = os.urandom(3000)
+
+    response = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=headers,
+                           json={'filename': 'lecture.mp4', 'size': len(body), 'title': 'Lecture 1'})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload']['id']
+
+    assert client.put(f'/api/uploads/{upload_id}?offset=0', headers=headers, data=body[:1000]).status_code == 200
+
+    # Resending from the wrong offset is rejected with the offset to resume from
+    response = client.put(f'/api/uploads/{upload_id}?offset=0', headers=headers, data=body[:1000])
+    assert response.status_code == 409 and response.get_json()['offset'] == 1000
+
+    assert client.get(f'/api/uploads/{upload_id}', headers=headers).get_json()['upload']['offset'] == 1000
+
+    response = client.put(f'/api/uploads/{upload_id}?offset=1000', headers=headers, data=body[1000:])
+    assert response.status_code == 201
+    material = response.get_json()['material']
+    assert material['title'] == 'Lecture 1'
+
+    with open(upload_dir / material['file_url'][len('/uploads/'):], 'rb') as f:
+        assert f.read() == body
+    assert not os.listdir(upload_dir / 'partial')
+
+
+def test_resume_rebuilds_hash_after_restart(client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    headers = auth_headers(teacher)
+    body = b'abcdef' * 100
+    upload_id = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=headers,
+                            json={'filename': 'notes.txt', 'size': len(body)}).get_json()['upload']['id']
+    client.put(f'/api/uploads/{upload_id}?offset=0', headers=headers, data=body[:250])
+
+    storage._partial_hashes.clear()  # As if the process restarted
+    response = client.put(f'/api/uploads/{upload_id}?offset=250', headers=headers, data=body[250:])
+    assert response.status_code == 201
+
+    assert hashlib.sha256(body).hexdigest() in response.get_json()['material']['file_url']
+
+
+def test_only_the_uploader_can_write(client, make_user, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    upload_id = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=auth_headers(teacher),
+                            json={'filename': 'a.pdf', 'size': 10}).get_json()['upload']['id']
+
+    other = auth_headers(make_user('teacher'))
+    assert client.put(f'/api/uploads/{upload_id}?offset=0', headers=other, data=b'x' * 10).status_code == 403
+    assert db.session.get(UploadSession, upload_id).offset == 0
+
+
+def _upload(client, headers, classroom, body, name='lecture.pdf'):
+    response = client.post(f'/api/classrooms/{classroom.id}/materials', headers=headers,
+                           data={'title': 'Lecture', 'file': (io.BytesIO(body), name)})
+    return response.get_json()['material']['file_url']
+
+
+def test_download_supports_range_and_conditional_get(client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    body = bytes(range(256)) * 40
+    url = _upload(client, auth_headers(teacher), classrooms[0], body)
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.data == body
+    assert 'immutable' in full.headers['Cache-Control']
+    assert full.headers['Accept-Ranges'] == 'bytes'
+
+    partial = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert partial.status_code == 206
+    assert partial.data == body[100:200]
+    assert partial.headers['Content-Range'] == f'bytes 100-199/{len(body)}'
+
+    # If-Range with the current ETag resumes; with a stale one the whole file comes back
+    resumed = client.get(url, headers={'Range': 'bytes=5000-', 'If-Range': full.headers['ETag']})
+    assert resumed.status_code == 206 and resumed.data == body[5000:]
+    stale = client.get(url, headers={'Range': 'bytes=5000-', 'If-Range': '"stale"'})
+    assert stale.status_code == 200
+
+    assert client.get(url, headers={'If-None-Match': full.headers['ETag']}).status_code == 304
+
+
+def test_download_offload_modes(app, client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    url = _upload(client, auth_headers(teacher), classrooms[0], b'%PDF offloaded')
+    filename = url[len('/uploads/'):]
+
+    try:
+        app.config['UPLOADS_OFFLOAD'] = 'x-accel'
+        response = client.get(url)
+        assert response.headers['X-Accel-Redirect'] == f'/protected-uploads/{filename}'
+        assert response.data == b''
+
+        app.config['UPLOADS_OFFLOAD'] = 'x-sendfile'
+        response = client.get(url)
+        assert response.headers['X-Sendfile'] == str(upload_dir / filename)
+    finally:
+        app.config['UPLOADS_OFFLOAD'] = None
+
+
+def test_partial_uploads_are_not_downloadable(client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    headers = auth_headers(teacher)
+    upload_id = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=headers,
+                            json={'filename': 'a.pdf', 'size': 10}).get_json()['upload']['id']
+    client.put(f'/api/uploads/{upload_id}?offset=0', headers=headers, data=b'12345')
+
+    assert client.get(f'/uploads/partial/{upload_id}').status_code == 404
+    assert client.get(f'/uploads/./partial/{upload_id}').status_code == 404
+    assert client.get(f'/uploads/cas/../partial/{upload_id}').status_code == 404
+    assert client.get('/uploads/../app.py').status_code == 404
+
+
+def test_declared_size_is_limited(app, client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    response = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=auth_headers(teacher),
+                           json={'filename': 'huge.iso', 'size': app.config['MAX_CONTENT_LENGTH'] + 1})
+
+    assert response.status_code == 413
+    assert UploadSession.query.count() == 0
+
+
+def test_idle_uploads_expire(app, client, auth_headers, upload_dir, teacher_classrooms):
+    teacher, classrooms = teacher_classrooms
+    headers = auth_headers(teacher)
+
+    def start(name, data=None):
+        upload_id = client.post(f'/api/classrooms/{classrooms[0].id}/uploads', headers=headers,
+                                json={'filename': name, 'size': 10}).get_json()['upload']['id']
+        if data:
+            client.put(f'/api/uploads/{upload_id}?offset=0', headers=headers, data=data)
+        return upload_id
+
+    abandoned = start('a.pdf', b'12345')
+    start('b.pdf')  # Never sent a byte
+    active = start('c.pdf', b'12345')
+    long_ago = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_SESSION_MAX_AGE'] + 60)
+    UploadSession.query.update({UploadSession.created_at: long_ago})
+    db.session.commit()
+    stale_time = time.time() - app.config['UPLOAD_SESSION_MAX_AGE'] - 60
+    os.utime(storage.partial_path(abandoned), (stale_time, stale_time))
+
+    assert expire_uploads() == 2
+    db.session.commit()
+
+    assert [u.id for u in UploadSession.query] == [active]
+    assert os.listdir(upload_dir / 'partial') == [active]
+    assert storage._partial_hashes.get(abandoned) is None
@@ -0,0 +1,53 @@
+"""
+Tests for the cached authenticated-user lookup
+"""
+from models import db, User
+from query_audit import capture_statements
+from user_cache import UserSnapshot
+
+
+def _user_selects(client, url, headers):
+    with capture_statements() as statements:
+        response = client.get(url, headers=headers)
+    return response, [sql for sql, _ in statements if 'FROM users' in sql]
+
+
+def test_repeat_requests_skip_user_lookup(client, make_user, auth_headers):
+    headers = auth_headers(make_user('teacher'))
+
+    response, selects = _user_selects(client, '/api/user', headers)
+    assert response.status_code == 200 and len(selects) == 1
+
+    response, selects = _user_selects(client, '/api/classrooms', headers)
+    assert response.status_code == 200 and selects == []
+
+
+def test_role_change_invalidates_cached_user(client, make_user, auth_headers):
+    user = make_user('student')
+    headers = auth_headers(user)
+    assert client.get('/api/user', headers=headers).get_json()['role'] == 'student'
+
+    user.role = 'teacher'
+    db.session.commit()
+
+    response, selects = _user_selects(client, '/api/user', headers)
+    assert response.get_json()['role'] == 'teacher' and len(selects) == 1
+
+
+def test_deleted_user_is_rejected(client, make_user, auth_headers):
+    user = make_user('student')
+    headers = auth_headers(user)
+    assert client.get('/api/user', headers=headers).status_code == 200
+
+    db.session.delete(user)
+    db.session.commit()
+
+    assert client.get('/api/user', headers=headers).status_code == 404
+    assert User.query.count() == 0
+
+
+def test_snapshot_has_the_same_shape_as_the_user(app, make_user):
+    user = make_user('teacher')
+
+    assert UserSnapshot(user).to_dict() == user.to_dict()
+    assert set(user.to_dict()) == set(User.ROW_FIELDS)
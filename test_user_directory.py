@@ -0,0 +1,84 @@
+"""
+Tests for the searchable, paginated user directory
+"""
+from models import db, Organization
+
+
+def _users(client, headers, query=''):
+    response = client.get(f'/api/users{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_pages_are_ordered_by_name(client, make_user, auth_headers):
+    for name in ['carol', 'Bob', 'alice', 'Dave', 'erin']:
+        make_user(name=name)
+    headers = auth_headers(make_user(name='Zed'))
+
+    first = _users(client, headers, '?limit=2')
+    assert [u['name'] for u in first['users']] == ['alice', 'Bob']
+    names = [u['name'] for u in first['users']]
+    cursor = first['next_cursor']
+    while cursor:
+        page = _users(client, headers, f'?limit=2&after={cursor}')
+        names += [u['name'] for u in page['users']]
+        cursor = page['next_cursor']
+    assert names == ['alice', 'Bob', 'carol', 'Dave', 'erin', 'Zed']
+
+
+def test_prefix_search_on_name_and_email(client, make_user, auth_headers):
+    make_user(name='Maria Lopez')
+    make_user(name='Mark Twain')
+    make_user('teacher', name='Ada')  # email teacher3@iomp.test
+    headers = auth_headers(make_user(name='Zed'))
+
+    assert [u['name'] for u in _users(client, headers, '?q=mar')['users']] == ['Maria Lopez', 'Mark Twain']
+    assert [u['name'] for u in _users(client, headers, '?q=MARK')['users']] == ['Mark Twain']
+    assert [u['name'] for u in _users(client, headers, '?q=teacher')['users']] == ['Ada']
+    assert _users(client, headers, '?q=twain')['users'] == []
+
+
+def test_invalid_cursor_is_rejected(client, make_user, auth_headers):
+    response = client.get('/api/users?after=not-a-cursor', headers=auth_headers(make_user()))
+
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': 'Invalid cursor'}
+
+
+def test_prefix_search_folds_case_like_sqlite(client, make_user, auth_headers):
+    make_user(name='Émile Zola')
+    ada = make_user(name='Ada')
+    ada.email = 'Ada.Lovelace@IOMP.test'
+    db.session.commit()
+    headers = auth_headers(make_user(name='Zed'))
+
+    # Non-ASCII letters are matched as typed; ASCII ones in any case
+    assert [u['name'] for u in _users(client, headers, '?q=ÉMILE')['users']] == ['Émile Zola']
+    assert [u['name'] for u in _users(client, headers, '?q=Émile z')['users']] == ['Émile Zola']
+    assert [u['name'] for u in _users(client, headers, '?q=ada.LOVE')['users']] == ['Ada']
+
+
+def test_role_and_organization_filters(client, make_user, auth_headers):
+    org = Organization(name='A', domain='a.test')
+    db.session.add(org)
+    db.session.commit()
+    make_user('teacher', name='T1', organization_id=org.id)
+    make_user('student', name='S1', organization_id=org.id)
+    make_user('teacher', name='T2')
+    headers = auth_headers(make_user('admin', name='Admin'))
+
+    assert [u['name'] for u in _users(client, headers, '?role=teacher')['users']] == ['T1', 'T2']
+    assert [u['name'] for u in _users(client, headers, f'?organization_id={org.id}')['users']] == ['S1', 'T1']
+    both = _users(client, headers, f'?organization_id={org.id}&role=teacher')['users']
+    assert [u['name'] for u in both] == ['T1']
+
+
+def test_compact_mode(client, make_user, auth_headers):
+    me = make_user('teacher', name='Ada')
+    assert _users(client, auth_headers(me), '?compact=1')['users'] == [{'id': me.id, 'name': 'Ada', 'role': 'teacher'}]
+    assert 'email' in _users(client, auth_headers(me), '?compact=0')['users'][0]
+
+
+def test_invalid_cursor(client, make_user, auth_headers):
+    response = client.get('/api/users?after=not-a-cursor', headers=auth_headers(make_user()))
+    assert response.status_code == 400
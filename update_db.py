@@ -1,6 +1,54 @@
+from sqlalchemy import inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
 from app import app
-from models import db
+from models import db, Post, User
+from attendance import remove_duplicate_attendance, rebuild_attendance_summaries
+from notifications import rebuild_notification_counters
+from conversations import rebuild_conversations
+from search import rebuild_search_index
 
 with app.app_context():
     db.create_all()
     print("Database tables updated (including 'posts').")
+
+    # create_all() doesn't add new columns to existing tables either (all of them are nullable)
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(db.engine.dialect)
+                db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Added column {table.name}.{column.name}")
+    db.session.commit()
+
+    # Posts are scoped to their author's organization
+    author_org = select(User.organization_id).where(User.id == Post.author_id).scalar_subquery()
+    backfilled = Post.query.filter(Post.organization_id.is_(None)) \
+        .update({Post.organization_id: author_org}, synchronize_session=False)
+    print(f"Post organizations backfilled: {backfilled}")
+
+    # Attendance used to allow several rows per student per day; keep the latest
+    print(f"Duplicate attendance rows removed: {remove_duplicate_attendance()}")
+
+    # create_all() skips tables that already exist, so add any new indexes to them
+    # (IF NOT EXISTS rather than checkfirst, which can't see expression indexes like lower(name))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+    db.session.commit()
+    print("Indexes updated.")
+
+    # Attendance totals are maintained incrementally; recompute them from history
+    print(f"Attendance summaries rebuilt ({rebuild_attendance_summaries()} student/classroom pairs).")
+
+    # Unread notification counters are maintained incrementally too
+    print(f"Notification counters rebuilt ({rebuild_notification_counters()} users).")
+
+    # Per-conversation read state is maintained by send_message; backfill it from history
+    print(f"Conversations rebuilt ({rebuild_conversations()} threads).")
+
+    # The full-text indexes only hold tokens; re-read them from the content tables
+    print(f"Search index rebuilt ({rebuild_search_index()} rows).")
+    db.session.commit()
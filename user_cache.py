@@ -0,0 +1,84 @@
+"""
+Cached lookup of the authenticated user for @jwt_required endpoints
+
+flask_jwt_extended calls load_user once per request and keeps the result
+for that request as `current_user`. Across requests, users are cached as
+read-only UserSnapshot objects keyed by id, so authorization checks (role,
+organization) don't cost a database round trip every time.
+
+Keys are namespaced by database (tenancy.cache_key), since an organization
+with its own database has its own id sequence.
+
+Any ORM insert, update or delete of a User drops its entry. Bulk statements
+that bypass the ORM (import_users.py runs in its own process anyway) are
+only bounded by the TTL.
+"""
+from flask import current_app, jsonify
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from cache import user_cache
+from models import User
+import tenancy
+
+
+class UserSnapshot:
+    """Detached, read-only copy of the User columns handlers need (User.ROW_FIELDS)"""
+
+    __slots__ = User.ROW_FIELDS
+
+    def __init__(self, user):
+        for field in self.__slots__:
+            setattr(self, field, getattr(user, field))
+
+    # Only reads ROW_FIELDS, so it gives exactly User.to_dict()'s shape
+    to_dict = User.to_dict
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.email}>'
+
+
+def _fetch(user_id):
+    user = User.query.filter_by(id=user_id).first()
+    return UserSnapshot(user) if user else None
+
+
+def get_user_snapshot(user_id):
+    """Return the cached UserSnapshot for user_id, or None if there is no such user"""
+    return user_cache.get_or_compute(tenancy.cache_key(int(user_id)), lambda: _fetch(int(user_id)))
+
+
+def _invalidate(mapper, connection, target):
+    key = tenancy.cache_key(target.id)
+    user_cache.invalidate(key)
+    # A request may re-cache the old row before this transaction commits,
+    # so drop the entry again once it has
+    object_session(target).info.setdefault('changed_user_keys', set()).add(key)
+
+
+def _invalidate_committed(session):
+    for key in session.info.pop('changed_user_keys', ()):
+        user_cache.invalidate(key)
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(User, _event, _invalidate)
+event.listen(Session, 'after_commit', _invalidate_committed)
+
+
+def init_user_loader(jwt):
+    """Make get_user_snapshot the JWTManager's user_lookup_loader"""
+    @jwt.user_lookup_loader
+    def load_user(_jwt_header, jwt_data):
+        # Route to the organization's database before looking the user up
+        if 'org' in jwt_data:
+            tenancy.activate(jwt_data['org'])
+        user = get_user_snapshot(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
+        if user is not None and 'org' not in jwt_data:
+            tenancy.activate(user.organization_id)  # Token from before the claim existed
+        return user
+
+    # Tokens for deleted users keep getting the 404 handlers used to return
+    @jwt.user_lookup_error_loader
+    def user_not_found(_jwt_header, _jwt_data):
+        return jsonify({'success': False, 'message': 'User not found'}), 404